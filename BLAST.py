@@ -1,82 +1,50 @@
+import asyncio
+import numpy as np
 import pandas as pd
 import subprocess
 import os
 import tempfile
-from collections import defaultdict
 from tqdm import tqdm
-import multiprocessing as mp
-from functools import partial
 
 # Пути к данным
-from prepare_rna import df_sense, df_antisense
+from alignment_score import ALIGNMENT_OPTIONS, AlignmentAccumulator
+from blast_async import StdinBlast
+from blast_cache import BlastCache, search_key
+from blast_parser import SpecificityAccumulator, TitleTable, iter_hit_chunks, outfmt_fields
+from blast_scheduler import AdaptiveScheduler
+from nested_blast import maximal_tiles, nested_batches
+from offtarget_index import MAX_MISMATCHES, KmerIndex, searchable
+from prepare_rna import get_session
+from results_store import save_results
+from sampling import SAMPLE_SEED, SampleTracker, format_estimates, strata, stratified_sample
 
 # Путь к BLAST базе
-BLAST_DB = "/home/nikolay/blast_dbs/human_refseq_complete"
+BLAST_DB = os.environ.get("BLAST_DB", "/home/nikolay/blast_dbs/human_refseq_complete")
+# Транскриптом RefSeq (FASTA) для встроенного поиска off-target без blastn
+TRANSCRIPTS_FASTA = os.environ.get("TRANSCRIPTS_FASTA", "GCF_000001405.40_GRCh38.p14_rna.fna")
 
 
 def collect_all_unique_sequences():
     print(" СБОР ВСЕХ УНИКАЛЬНЫХ ПОСЛЕДОВАТЕЛЬНОСТЕЙ")
+    catalog = get_session().catalog
 
-    unique_sequences = set()
-    seq_to_sirna = defaultdict(list)  # Сопоставление последовательности с siRNA
+    # Сопоставление последовательности с siRNA: [(цепь, fragment_id), ...]
+    seq_to_sirna = catalog.by_sequence
+    unique_sequences = catalog.unique_sequences()
+    total = 2 * len(catalog)
 
-    # Собираем sense strands
-    for idx, row in df_sense.iterrows():
-        seq = row['sequence']
-        fragment_id = row['fragment_id']
-        unique_sequences.add(seq)
-        seq_to_sirna[seq].append(('sense', fragment_id))
-
-    # Собираем antisense strands
-    for idx, row in df_antisense.iterrows():
-        seq = row['sequence']
-        fragment_id = row['fragment_id']
-        unique_sequences.add(seq)
-        seq_to_sirna[seq].append(('antisense', fragment_id))
-
-    print(f"   Всего последовательностей: {len(df_sense) + len(df_antisense)}")
+    print(f"   Всего последовательностей: {total}")
     print(f"   Уникальных последовательностей: {len(unique_sequences)}")
-    print(f"   Экономия: {100 - len(unique_sequences) / (len(df_sense) + len(df_antisense)) * 100:.1f}%")
-
-    return list(unique_sequences), seq_to_sirna
-
-
-def create_batch_files(sequences, batch_size=1000):
-    print(f" СОЗДАНИЕ БАТЧ-ФАЙЛОВ (размер батча: {batch_size})")
-
-    batches = []
-    batch_dir = "blast_batches"
-    os.makedirs(batch_dir, exist_ok=True)
+    print(f"   Экономия: {100 - len(unique_sequences) / total * 100:.1f}%")
 
-    for i in range(0, len(sequences), batch_size):
-        batch_seqs = sequences[i:i + batch_size]
-        batch_file = os.path.join(batch_dir, f"batch_{i // batch_size}.fasta")
+    return unique_sequences, seq_to_sirna
 
-        with open(batch_file, 'w') as f:
-            for idx, seq in enumerate(batch_seqs):
-                seq_id = f"seq_{i + idx}"
-                f.write(f">{seq_id}\n{seq}\n")
-
-        batches.append({
-            'file': batch_file,
-            'sequences': batch_seqs,
-            'start_idx': i,
-            'batch_num': i // batch_size
-        })
-
-    print(f"   Создано {len(batches)} батч-файлов")
-    return batches
-
-
-def run_batch_blast(batch_info):
-    batch_file = batch_info['file']
-    batch_num = batch_info['batch_num']
-    batch_size = len(batch_info['sequences'])
 
+def blast_command(query_file, num_threads=2, options=None):
     # Оптимизированные параметры для быстрого BLAST
     cmd = [
         "blastn",
-        "-query", batch_file,
+        "-query", query_file,
         "-db", BLAST_DB,
         "-task", "blastn-short",
         "-word_size", "7",  # Увеличили для скорости
@@ -87,170 +55,80 @@ def run_batch_blast(batch_info):
         "-perc_identity", "70",  # Минимум 80% идентичности
         "-qcov_hsp_perc", "50",  # Минимум 80% покрытия
         "-dust", "no",  # Фильтр низкокомплексных регионов
-        "-num_threads", "2"  # Используем 2 потока
+        "-num_threads", str(num_threads)  # Потоки на процесс (подбирает blast_scheduler.plan_resources)
     ]
+    # Замена значений отдельных параметров, например {"-outfmt": "6 ... btop"}
+    for flag, value in (options or {}).items():
+        cmd[cmd.index(flag) + 1] = str(value)
+    return cmd
+
 
-    try:
-        # Запускаем BLAST
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)  # 5 минут таймаут
-
-        # Парсим результаты
-        blast_results = defaultdict(list)
-        for line in result.stdout.strip().split('\n'):
-            if line and not line.startswith('#'):
-                parts = line.split('\t')
-                if len(parts) >= 2:
-                    seq_id = parts[0]  # Например: seq_0
-                    blast_results[seq_id].append(line)
-
-        # Логируем прогресс
-        with open(f"blast_batches/batch_{batch_num}_log.txt", 'w') as log:
-            log.write(f"Батч {batch_num}: {batch_size} последовательностей\n")
-            log.write(f"Найдено совпадений: {len(blast_results)}\n")
-            if result.stderr:
-                log.write(f"Ошибки: {result.stderr}\n")
-
-        return {
-            'batch_num': batch_num,
-            'blast_results': dict(blast_results),
-            'status': 'success',
-            'total_sequences': batch_size,
-            'matches_found': len(blast_results)
-        }
-
-    except subprocess.TimeoutExpired:
-        return {
-            'batch_num': batch_num,
-            'blast_results': {},
-            'status': 'timeout',
-            'total_sequences': batch_size,
-            'matches_found': 0
-        }
-    except Exception as e:
-        return {
-            'batch_num': batch_num,
-            'blast_results': {},
-            'status': f'error: {str(e)}',
-            'total_sequences': batch_size,
-            'matches_found': 0
-        }
-
-
-def process_all_batches_parallel(batches, num_workers=4):
-    print(f" ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА BLAST ({num_workers} потоков)")
-
-    with mp.Pool(processes=num_workers) as pool:
-        results = list(tqdm(
-            pool.imap(run_batch_blast, batches),
-            total=len(batches),
-            desc="BLAST обработка"
-        ))
-
-    return results
-
-
-def analyze_blast_results_simple(blast_output, sequence):
-    if not blast_output:
-        return True, "No hits"  # Нет совпадений - отлично!
-
-    lines = blast_output.strip().split('\n')
-
-    for line in lines:
-        parts = line.split('\t')
-        if len(parts) >= 13:
-            subject_title = parts[12]
-            pident = float(parts[2])
-            length = int(parts[3])
-
-            # Если это не наш целевой ген ATXN1
-            if "ATXN1" not in subject_title.upper():
-                # Проверяем качество совпадения
-                coverage = (length / len(sequence)) * 100
-                if coverage > 70 and pident > 70:  # Хорошее совпадение с другим геном
-                    return False, f"Match to {subject_title} ({coverage:.1f}%, {pident:.1f}% id)"
-
-    return True, "Specific"
+def stdin_blast():
+    """run_batch для AdaptiveScheduler.run_async: запросы подаются blastn через stdin"""
+    return StdinBlast(lambda num_threads, options: blast_command("-", num_threads, options), BLAST_DB)
 
 
 def compile_results(batch_results, sequences, seq_to_sirna):
     print(" КОМПИЛЯЦИЯ РЕЗУЛЬТАТОВ")
+    catalog = get_session().catalog
 
-    # Создаем словарь для результатов каждой последовательности
-    sequence_results = {}
-
-    # Обрабатываем результаты батчей
-    for batch in batch_results:
-        if batch['status'] != 'success':
-            continue
-
-        for seq_id, blast_output in batch['blast_results'].items():
-            # Извлекаем индекс из seq_id (например, seq_123 -> 123)
-            idx = int(seq_id.split('_')[1])
-
-            # Находим соответствующую последовательность
-            if idx < len(sequences):
-                seq = sequences[idx]
-                is_specific, reason = analyze_blast_results_simple('\n'.join(blast_output), seq)
-                sequence_results[seq] = {
-                    'specific': is_specific,
-                    'reason': reason,
-                    'hits_count': len(blast_output)
-                }
-
-    # Теперь собираем результаты по siRNA
-    sirna_results = []
+    # Результаты последовательностей с совпадениями из успешных батчей (индекс - последовательность)
+    summaries = [batch['summary'] for batch in batch_results if batch['status'] == 'success']
+    sequence_results = pd.concat(summaries) if summaries else pd.DataFrame(
+        columns=['specific', 'reason', 'hits_count'])
+    sequence_results = sequence_results[sequence_results['hits_count'] > 0]
+    sequence_results.index = [sequences[idx] for idx in sequence_results.index]
 
     print(" СБОР РЕЗУЛЬТАТОВ ПО siRNA...")
-    for fragment_id in tqdm(df_sense['fragment_id'].unique(), desc="Обработка siRNA"):
-        # Находим sense и antisense последовательности для этой siRNA
-        sense_row = df_sense[df_sense['fragment_id'] == fragment_id].iloc[0]
-        anti_row = df_antisense[df_antisense['fragment_id'] == fragment_id].iloc[0]
-
-        sense_seq = sense_row['sequence']
-        anti_seq = anti_row['sequence']
-        size_nt = sense_row['size_nt']
-
-        # Получаем результаты для sense
-        sense_result = sequence_results.get(sense_seq, {'specific': True, 'reason': 'No data', 'hits_count': 0})
-        anti_result = sequence_results.get(anti_seq, {'specific': True, 'reason': 'No data', 'hits_count': 0})
-
-        # Подсчет BLAST score
-        if sense_result['specific'] and anti_result['specific']:
-            blast_score = 2
-        elif sense_result['specific'] or anti_result['specific']:
-            blast_score = 1
-        else:
-            blast_score = 0
-
-        sirna_results.append({
-            'fragment_id': fragment_id,
-            'size_nt': size_nt,
-            'sense_sequence': sense_seq,
-            'antisense_sequence': anti_seq,
-            'sense_specific': sense_result['specific'],
-            'antisense_specific': anti_result['specific'],
-            'sense_hits': sense_result['hits_count'],
-            'antisense_hits': anti_result['hits_count'],
-            'sense_reason': sense_result['reason'],
-            'antisense_reason': anti_result['reason'],
-            'blast_score': blast_score
-        })
-
-    return pd.DataFrame(sirna_results)
-
-
-def save_and_analyze_results(results_df):
+    # Пары берутся из каталога: один проход по siRNA, без поиска строк по fragment_id
+    return sirna_results(catalog, sequence_results.reindex(catalog.sense_sequences),
+                         sequence_results.reindex(catalog.antisense_sequences))
+
+
+def sirna_results(catalog, sense_matched, antisense_matched):
+    """Итоговая таблица по парам каталога из результатов цепей (строка i - пара i, NaN - нет данных)"""
+    # Последовательности без данных BLAST считаются специфичными
+    results = {}
+    for strand, matched in (('sense', sense_matched), ('antisense', antisense_matched)):
+        results[f'{strand}_specific'] = matched['specific'].fillna(True).astype(bool).to_numpy()
+        results[f'{strand}_hits'] = matched['hits_count'].fillna(0).astype(int).to_numpy()
+        results[f'{strand}_reason'] = matched['reason'].fillna('No data').to_numpy()
+
+    # Подсчет BLAST score: по баллу за каждую специфичную цепь
+    blast_score = results['sense_specific'].astype(int) + results['antisense_specific'].astype(int)
+
+    return pd.DataFrame({
+        'fragment_id': catalog.fragment_ids,
+        'size_nt': catalog.size_nt,
+        'sense_sequence': catalog.sense_sequences,
+        'antisense_sequence': catalog.antisense_sequences,
+        'sense_specific': results['sense_specific'],
+        'antisense_specific': results['antisense_specific'],
+        'sense_hits': results['sense_hits'],
+        'antisense_hits': results['antisense_hits'],
+        'sense_reason': results['sense_reason'],
+        'antisense_reason': results['antisense_reason'],
+        'blast_score': blast_score
+    })
+
+
+def save_and_analyze_results(results_df, prefix='sirna_blast', store=True):
     """
-    Сохранение и анализ результатов
+    Сохранение и анализ результатов; store=False - только CSV, столбцы blast в хранилище не меняются
     """
     print("\n СОХРАНЕНИЕ РЕЗУЛЬТАТОВ")
 
     # Сохраняем все результаты
-    results_df.to_csv('sirna_blast_only_results.csv', index=False)
+    all_file, good_file = f'{prefix}_only_results.csv', f'{prefix}_good_results.csv'
+    results_df.to_csv(all_file, index=False)
+    if store:
+        save_results(results_df, 'blast', columns=['sense_specific', 'antisense_specific', 'sense_hits',
+                                                    'antisense_hits', 'sense_reason', 'antisense_reason',
+                                                    'blast_score'])
 
     # Фильтруем только хорошие siRNA (score 2)
     good_sirnas = results_df[results_df['blast_score'] == 2]
-    good_sirnas.to_csv('sirna_blast_good_results.csv', index=False)
+    good_sirnas.to_csv(good_file, index=False)
 
     # Статистика
     total = len(results_df)
@@ -283,11 +161,11 @@ def save_and_analyze_results(results_df):
                 print(f"     Anti:  {row['antisense_reason']}")
 
     print(f"\n ФАЙЛЫ:")
-    print(f"   • Все результаты: sirna_blast_only_results.csv")
-    print(f"   • Хорошие siRNA (score 2): sirna_blast_good_results.csv")
+    print(f"   • Все результаты: {all_file}")
+    print(f"   • Хорошие siRNA (score 2): {good_file}")
 
 
-def main_full_blast_check():
+def main_full_blast_check(alignment_scoring=False):
     print("=" * 80)
     print(" ПОЛНАЯ BLAST ПРОВЕРКА ВСЕХ siRNA (32888 пар)")
     print("=" * 80)
@@ -295,14 +173,28 @@ def main_full_blast_check():
     # Шаг 1: Сбор всех уникальных последовательностей
     sequences, seq_to_sirna = collect_all_unique_sequences()
 
-    # Шаг 2: Создание батч-файлов
-    batches = create_batch_files(sequences, batch_size=500)  # 500 последовательностей в батче
+    # Последовательности из кэша BLAST ставятся в конец: батчи промахов идут первыми и плотными
+    options = ALIGNMENT_OPTIONS if alignment_scoring else None
+    cached = BlastCache().get_many(sequences, search_key(BLAST_DB, blast_command("-", options=options)))
+    sequences.sort(key=lambda seq: seq in cached)
+    print(f"   В кэше BLAST: {len(cached)}, к запуску: {len(sequences) - len(cached)}")
 
-    # Шаг 3: Параллельная обработка
+    # Шаги 2-3: батчи создаются по ходу работы - их размер подстраивается под скорость BLAST
     print("\n⚡ ЗАПУСК ПАРАЛЛЕЛЬНОГО BLAST...")
     print("   Это может занять 30-60 минут в зависимости от системы")
 
-    batch_results = process_all_batches_parallel(batches, num_workers=4)
+    # Один процесс asyncio: blastn читает запросы из stdin, батч-файлы не нужны - несколько запусков
+    # в одном каталоге не мешают друг другу
+    def make_batch(start, end, batch_num):
+        batch = {'sequences': sequences[start:end], 'start_idx': start, 'batch_num': batch_num}
+        if alignment_scoring:
+            # Специфичность по штрафу несовпадений с учетом позиции (seed 2-8) вместо покрытия/идентичности
+            batch['blast_options'] = options
+            batch['accumulator'] = AlignmentAccumulator([len(seq) for seq in batch['sequences']], start)
+        return batch
+
+    scheduler = AdaptiveScheduler(len(sequences), make_batch=make_batch, run_batch=stdin_blast())
+    batch_results = asyncio.run(scheduler.run_async())
 
     # Шаг 4: Анализ статусов батчей
     print("\n📈 СТАТУСЫ БАТЧЕЙ:")
@@ -313,6 +205,9 @@ def main_full_blast_check():
 
     for status, count in status_counts.items():
         print(f"   {status}: {count} батчей")
+    for batch in batch_results:
+        if batch['status'] != 'success' and batch.get('stderr'):
+            print(f"   Батч {batch['batch_num']}: {batch['stderr'].strip()[:200]}")
 
     # Шаг 5: Компиляция результатов
     print("\n📊 КОМПИЛЯЦИЯ ВСЕХ РЕЗУЛЬТАТОВ...")
@@ -328,21 +223,137 @@ def main_full_blast_check():
     return results_df
 
 
-def quick_blast_check():
-    print("БЫСТРАЯ ПРОВЕРКА (первые 1000 siRNA)")
+def main_nested_blast_check(tile_length=None):
+    print("=" * 80)
+    print(" BLAST ТОЛЬКО МАКСИМАЛЬНЫХ ТАЙЛОВ С ПРОЕКЦИЕЙ НА ВЛОЖЕННЫЕ ОКНА")
+    print("=" * 80)
+
+    session = get_session()
+    catalog, sense_table = session.catalog, session.sense_table
+    tile_starts, tile_length = maximal_tiles(len(sense_table.buffer), session.end_size, tile_length)
+    buffer = sense_table.buffer.decode('ascii')
+    tile_sequences = [buffer[start:start + tile_length] for start in tile_starts]
+    print(f"   Окон: {len(catalog)}, запросов BLAST: {len(tile_sequences)} тайлов по {tile_length} нт")
+
+    # BLAST ищет на обеих цепях: совпадение antisense-гида - то же выравнивание, что и у его sense-окна
+    scheduler = AdaptiveScheduler(len(tile_sequences),
+                                  make_batch=nested_batches(sense_table, tile_sequences, tile_starts, tile_length),
+                                  run_batch=stdin_blast())
+    batch_results = asyncio.run(scheduler.run_async())
 
-    # Берем первые 1000 siRNA
-    df_sense_small = df_sense.head(1000)
-    df_antisense_small = df_antisense.head(1000)
+    summaries = [batch['summary'] for batch in batch_results if batch['status'] == 'success']
+    window_results = pd.concat(summaries) if summaries else pd.DataFrame(columns=['specific', 'reason', 'hits_count'])
+    window_results = window_results[window_results['hits_count'] > 0].reindex(np.arange(len(catalog)))
 
-    # Собираем уникальные последовательности
-    sequences = set()
-    for seq in df_sense_small['sequence']:
-        sequences.add(seq)
-    for seq in df_antisense_small['sequence']:
-        sequences.add(seq)
+    results_df = sirna_results(catalog, window_results, window_results)
+    save_and_analyze_results(results_df)
+    return results_df
 
-    sequences = list(sequences)
+
+def main_sampled_blast_check(sample_size=2000, seed=SAMPLE_SEED, alignment_scoring=False):
+    print("=" * 80)
+    print(f" ОЦЕНКА ПО СТРАТИФИЦИРОВАННОЙ ВЫБОРКЕ ({sample_size} пар, seed={seed})")
+    print("=" * 80)
+
+    session = get_session()
+    catalog, sense_table = session.catalog, session.sense_table
+    # Страты - длина x участок региона: выборка покрывает все пространство дизайна, а не начало региона
+    population_stratum = strata(catalog.size_nt, sense_table.starts, len(sense_table.buffer))
+    rows = stratified_sample(population_stratum, sample_size, seed)
+    print(f"   Выборка: {len(rows)} из {len(catalog)} пар, страт: {len(np.unique(population_stratum))}")
+
+    # Последовательности идут парами в случайном порядке выборки: каждый батч завершает целые пары
+    sequences = list(dict.fromkeys(seq for row in rows for seq in (catalog.sense_sequences[row],
+                                                                   catalog.antisense_sequences[row])))
+    sequence_index = {seq: idx for idx, seq in enumerate(sequences)}
+    tracker = SampleTracker([sequence_index[catalog.sense_sequences[row]] for row in rows],
+                            [sequence_index[catalog.antisense_sequences[row]] for row in rows],
+                            population_stratum[rows], population_stratum, len(sequences))
+
+    options = ALIGNMENT_OPTIONS if alignment_scoring else None
+
+    def make_batch(start, end, batch_num):
+        batch = {'sequences': sequences[start:end], 'start_idx': start, 'batch_num': batch_num}
+        if alignment_scoring:
+            batch['blast_options'] = options
+            batch['accumulator'] = AlignmentAccumulator([len(seq) for seq in batch['sequences']], start)
+        return batch
+
+    scheduler = AdaptiveScheduler(len(sequences), make_batch=make_batch, run_batch=stdin_blast(),
+                                  on_result=tracker.add)
+    asyncio.run(scheduler.run_async())
+
+    scores = tracker.scores()
+    sample_df = pd.DataFrame({
+        'fragment_id': catalog.fragment_ids[rows],
+        'size_nt': catalog.size_nt[rows],
+        'stratum': population_stratum[rows],
+        'sense_sequence': [catalog.sense_sequences[row] for row in rows],
+        'antisense_sequence': [catalog.antisense_sequences[row] for row in rows],
+        'blast_score': pd.array(np.where(np.isnan(scores), pd.NA, scores), dtype="Int64")
+    })
+    sample_df.to_csv('sirna_blast_sample_results.csv', index=False)
+
+    estimates = tracker.estimates
+    if estimates is None:
+        print("\n  Ни одна пара не оценена (все батчи завершились с ошибкой)")
+        return sample_df, None
+    estimates.to_csv('sirna_blast_sample_estimates.csv', index=False)
+    print(f"\n📊 ОЦЕНКА ДОЛЕЙ BLAST SCORE (95% доверительные интервалы):")
+    print(f"   {format_estimates(estimates)}")
+    print(f"   Пар: {estimates.attrs['pairs']}, страт с данными: "
+          f"{estimates.attrs['strata_covered']} из {estimates.attrs['strata']}")
+    print(f"\n ФАЙЛЫ:")
+    print(f"   • Выборка: sirna_blast_sample_results.csv")
+    print(f"   • Оценки: sirna_blast_sample_estimates.csv")
+    return sample_df, estimates
+
+
+def main_offtarget_check(max_mismatches=MAX_MISMATCHES, batch_size=5000):
+    print("=" * 80)
+    print(f" ПОИСК OFF-TARGET ПО ИНДЕКСУ k-МЕРОВ (до {max_mismatches} замен, обе цепи)")
+    print("=" * 80)
+    # Это не замена BLAST: правило покрытие > 70% и идентичность > 70% допускает ~0.3 x длины замен
+    # и частичные совпадения, а перебор такого радиуса по индексу k-меров неподъемен
+    print("   Ищутся только совпадения по всей длине без гэпов; частичные и более далекие совпадения,")
+    print("   которые отметил бы BLAST, не находятся. Результаты сохраняются отдельно от BLAST")
+
+    sequences, seq_to_sirna = collect_all_unique_sequences()
+    index = KmerIndex.open(TRANSCRIPTS_FASTA)
+    unsearchable = int((~searchable(sequences)).sum())
+    if unsearchable:
+        # Такие запросы остаются без совпадений - их специфичность индексом не проверена
+        print(f"   Последовательностей с основаниями вне ACGU (не проверяются индексом): {unsearchable}")
+
+    # Те же батчи и SpecificityAccumulator, но совпадения - только выравнивания без гэпов по всей длине
+    # с не более чем max_mismatches заменами (подмножество того, что находит BLAST)
+    batch_results = []
+    for start in tqdm(range(0, len(sequences), batch_size), desc="Поиск off-target"):
+        batch = sequences[start:start + batch_size]
+        titles = TitleTable()
+        hits = index.search(batch, max_mismatches, titles, query_offset=start)
+        accumulator = SpecificityAccumulator([len(seq) for seq in batch], start)
+        accumulator.add(hits, titles)
+        summary = accumulator.summary(titles)
+        batch_results.append({'batch_num': start // batch_size, 'summary': summary, 'status': 'success',
+                              'total_sequences': len(batch),
+                              'matches_found': int((summary['hits_count'] > 0).sum())})
+
+    results_df = compile_results(batch_results, sequences, seq_to_sirna)
+    save_and_analyze_results(results_df, prefix='sirna_offtarget_index', store=False)
+    return results_df
+
+
+def quick_blast_check(alignment_scoring=False):
+    print("БЫСТРАЯ ПРОВЕРКА (первые 1000 siRNA)")
+
+    # Берем первые 1000 siRNA (пары sense/antisense из каталога)
+    catalog = get_session().catalog
+    fragment_ids = catalog.fragment_ids[:1000]
+
+    # Собираем уникальные последовательности; номер последовательности - через словарь
+    sequences = list(dict.fromkeys(catalog.sense_sequences[:1000] + catalog.antisense_sequences[:1000]))
+    sequence_index = {seq: idx for idx, seq in enumerate(sequences)}
     print(f"   Уникальных последовательностей: {len(sequences)}")
 
     # Создаем один батч
@@ -366,64 +377,35 @@ def quick_blast_check():
         "-qcov_hsp_perc", "50",
         "-dust", "yes"
     ]
+    if alignment_scoring:
+        # qseq/sseq нужны для штрафа несовпадений по позициям гида
+        cmd[cmd.index("-outfmt") + 1] = ALIGNMENT_OPTIONS["-outfmt"]
 
     print("   Запуск BLAST...")
     result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
     os.unlink(batch_file)
 
-    # Парсим результаты
-    blast_results = defaultdict(list)
-    for line in result.stdout.strip().split('\n'):
-        if line and not line.startswith('#'):
-            parts = line.split('\t')
-            if len(parts) >= 2:
-                seq_id = parts[0]
-                blast_results[seq_id].append(line)
-
-    print(f"   Найдено совпадений для {len(blast_results)} последовательностей")
-
-    # Анализируем результаты
-    results = []
-    for idx in range(len(df_sense_small)):
-        sense_row = df_sense_small.iloc[idx]
-        anti_row = df_antisense_small.iloc[idx]
-
-        sense_seq = sense_row['sequence']
-        anti_seq = anti_row['sequence']
-
-        # Находим индексы последовательностей
-        sense_idx = sequences.index(sense_seq) if sense_seq in sequences else -1
-        anti_idx = sequences.index(anti_seq) if anti_seq in sequences else -1
-
-        # Проверяем специфичность
-        sense_specific = True
-        anti_specific = True
-
-        if sense_idx != -1 and f"seq_{sense_idx}" in blast_results:
-            sense_output = '\n'.join(blast_results[f"seq_{sense_idx}"])
-            sense_specific, _ = analyze_blast_results_simple(sense_output, sense_seq)
-
-        if anti_idx != -1 and f"seq_{anti_idx}" in blast_results:
-            anti_output = '\n'.join(blast_results[f"seq_{anti_idx}"])
-            anti_specific, _ = analyze_blast_results_simple(anti_output, anti_seq)
-
-        # Подсчет score
-        if sense_specific and anti_specific:
-            blast_score = 2
-        elif sense_specific or anti_specific:
-            blast_score = 1
-        else:
-            blast_score = 0
-
-        results.append({
-            'fragment_id': sense_row['fragment_id'],
-            'size_nt': sense_row['size_nt'],
-            'sense_sequence': sense_seq,
-            'antisense_sequence': anti_seq,
-            'blast_score': blast_score
-        })
-
-    results_df = pd.DataFrame(results)
+    # Все выравнивания разбираются и оцениваются по массивам, без разбора строк по одной
+    titles = TitleTable()
+    lengths = [len(seq) for seq in sequences]
+    accumulator = AlignmentAccumulator(lengths) if alignment_scoring else SpecificityAccumulator(lengths)
+    for _, hits in iter_hit_chunks(result.stdout.splitlines(), titles, fields=outfmt_fields(cmd)):
+        accumulator.add(hits, titles)
+    specific = accumulator.summary(titles)['specific'].to_numpy()
+
+    print(f"   Найдено совпадений для {int((accumulator.hits_count > 0).sum())} последовательностей")
+
+    # Анализируем результаты: номера последовательностей обеих цепей первых 1000 пар
+    sense_specific = specific[[sequence_index[seq] for seq in catalog.sense_sequences[:1000]]]
+    anti_specific = specific[[sequence_index[seq] for seq in catalog.antisense_sequences[:1000]]]
+
+    results_df = pd.DataFrame({
+        'fragment_id': fragment_ids,
+        'size_nt': catalog.size_nt[:1000],
+        'sense_sequence': catalog.sense_sequences[:1000],
+        'antisense_sequence': catalog.antisense_sequences[:1000],
+        'blast_score': sense_specific.astype(int) + anti_specific.astype(int)
+    })
 
     # Статистика
     score_2 = len(results_df[results_df['blast_score'] == 2])
@@ -446,13 +428,26 @@ if __name__ == "__main__":
     print("Выберите режим:")
     print("1. Полная проверка всех siRNA (32888 пар) - 30-60 минут")
     print("2. Быстрая проверка (первые 1000 siRNA) - 5 минут")
+    print("3. Быстрый скрининг почти точных совпадений по индексу транскриптома (без blastn, "
+          f"до {MAX_MISMATCHES} замен; не заменяет BLAST)")
+    print("4. BLAST только 30-меров с проекцией на вложенные окна (~16x меньше запросов)")
+    print("5. Полная проверка со штрафом несовпадений по позициям гида (seed 2-8)")
+    print("6. Оценка долей score по стратифицированной выборке (2000 пар) - несколько минут")
 
-    choice = input("Введите 1 или 2: ")
+    choice = input("Введите 1-6: ")
 
     if choice == "1":
         results = main_full_blast_check()
     elif choice == "2":
         results = quick_blast_check()
+    elif choice == "3":
+        results = main_offtarget_check()
+    elif choice == "4":
+        results = main_nested_blast_check()
+    elif choice == "5":
+        results = main_full_blast_check(alignment_scoring=True)
+    elif choice == "6":
+        results = main_sampled_blast_check()
     else:
         print("Неверный выбор. Запускаю быструю проверку...")
         results = quick_blast_check()
\ No newline at end of file
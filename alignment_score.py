@@ -0,0 +1,88 @@
+import numpy as np
+
+from blast_parser import SpecificityAccumulator
+
+# Выравнивание нужно по позициям: к столбцам исходного запуска добавляются qseq/sseq
+ALIGNMENT_OPTIONS = {
+    "-outfmt": "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore stitle qseq sseq",
+}
+# Вес несовпадения по позиции гида от 5'-конца: seed 2-8 почти отменяет сайленсинг,
+# центр (9-12, место разрезания) заметно снижает его, 3'-часть и концевые позиции почти не влияют
+SEED_WEIGHT = 1.0
+CENTRAL_WEIGHT = 0.5
+THREE_PRIME_WEIGHT = 0.25
+TERMINAL_WEIGHT = 0.1
+# Совпадение считается способным к сайленсингу, если штраф меньше одного несовпадения в seed
+MAX_PENALTY = 1.0
+
+
+def position_weights(lengths, width):
+    """Матрица весов (запрос x позиция) для запросов длины lengths; позиции за концом запроса - 0"""
+    lengths = np.asarray(lengths, dtype=np.int64)[:, None]
+    position = np.arange(1, width + 1)[None, :]
+    weights = np.select(
+        [position > lengths, (position == 1) | (position > lengths - 2), position <= 8, position <= 12],
+        [0.0, TERMINAL_WEIGHT, SEED_WEIGHT, CENTRAL_WEIGHT], THREE_PRIME_WEIGHT)
+    return weights
+
+
+def mismatch_masks(qseq, sseq, qstart, query_lengths):
+    """Маски несовпадений (совпадение x позиция запроса) по qseq/sseq всех совпадений за один проход.
+    Несовпадением считаются замены, гэпы и позиции вне выравнивания; вставка в субъекте
+    (гэп в запросе) портит следующую позицию запроса"""
+    query_lengths = np.asarray(query_lengths, dtype=np.int64)
+    width = int(query_lengths.max()) if len(query_lengths) else 0
+    masks = np.ones((len(query_lengths), width), dtype=bool)
+    masks[np.arange(width)[None, :] >= query_lengths[:, None]] = False
+    if not len(query_lengths):
+        return masks
+
+    # Все выравнивания - один буфер байтов; строка каждого столбца - через повтор номеров совпадений
+    alignment_lengths = np.fromiter(map(len, qseq), dtype=np.int64, count=len(query_lengths))
+    q = np.frombuffer(''.join(qseq).upper().encode('ascii'), dtype=np.uint8)
+    s = np.frombuffer(''.join(sseq).upper().encode('ascii'), dtype=np.uint8)
+    row = np.repeat(np.arange(len(query_lengths)), alignment_lengths)
+    offsets = np.cumsum(alignment_lengths) - alignment_lengths
+
+    residue = q != ord('-')
+    before = np.cumsum(residue) - residue
+    position = np.asarray(qstart, dtype=np.int64)[row] - 1 + before - before[offsets][row]
+    position = np.minimum(position, query_lengths[row] - 1)
+    cell = row * width + position
+
+    flat = masks.reshape(-1)
+    flat[cell[residue & (q == s)]] = False
+    flat[cell[~residue]] = True
+    return masks
+
+
+def alignment_penalty(hits, query_lengths):
+    """Штраф (взвешенная сумма несовпадений) и число несовпадений в seed для каждого совпадения"""
+    masks = mismatch_masks(hits['qseq'].tolist(), hits['sseq'].tolist(), hits['qstart'].to_numpy(), query_lengths)
+    penalty = (masks * position_weights(query_lengths, masks.shape[1])).sum(axis=1)
+    return penalty, masks[:, 1:8].sum(axis=1)
+
+
+class AlignmentAccumulator(SpecificityAccumulator):
+    """Специфичность по выравниванию: неспецифичен запрос с совпадением не с target,
+    штраф несовпадений которого (по позициям гида) меньше max_penalty"""
+    def __init__(self, query_lengths, query_offset=0, target="ATXN1", max_penalty=MAX_PENALTY):
+        super().__init__(query_lengths, query_offset, target)
+        self.max_penalty = max_penalty
+        self.bad_penalty = np.zeros(len(self.query_lengths))
+        self.bad_seed = np.zeros(len(self.query_lengths), dtype=np.int64)
+
+    def add(self, hits, titles):
+        query = hits['query'].to_numpy() - self.query_offset
+        self.hits_count += np.bincount(query, minlength=len(self.hits_count))
+        title = hits['stitle'].to_numpy()
+        penalty, seed = alignment_penalty(hits, self.query_lengths[query].astype(np.int64))
+        bad = self._offtarget_titles(titles)[title] & (penalty < self.max_penalty)
+        first_queries, rows = self._first_bad(query, bad)
+        self.bad_title[first_queries] = title[rows]
+        self.bad_penalty[first_queries] = penalty[rows]
+        self.bad_seed[first_queries] = seed[rows]
+
+    def _reason(self, q, titles):
+        return (f"Match to {titles.titles[self.bad_title[q]]} "
+                f"(penalty {self.bad_penalty[q]:.2f}, {self.bad_seed[q]} seed mm)")
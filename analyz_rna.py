@@ -1,73 +1,71 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
-from prepare_rna import df_sense, df_antisense
+from prepare_rna import get_session
 from helper import helper
+from results_store import save_results
+from rule_engine import RuleEngine
 
 class analyz_rna:
-    def __init__(self):
-        self.df_sense = df_sense
-        self.df_antisense = df_antisense
+    def __init__(self, session=None):
+        self.session = session if session is not None else get_session()
 
-    """Обработка sense-последовательности"""
+    @property
+    def df_sense(self):
+        return self.session.df_sense
 
-    def analyze_gc(self):
-        """GC content of 36–52%"""
-        results = []
-        for idx, sequence in enumerate(self.df_sense['sequence']):
-            # Преобразуем в верхний регистр для надежности
-            seq_upper = str(sequence).upper()
-            length = len(seq_upper)
+    @property
+    def df_antisense(self):
+        return self.session.df_antisense
 
-            g_count = seq_upper.count('G')
-            c_count = seq_upper.count('C')
-            gc_count = g_count + c_count
+    @property
+    def engine(self):
+        """Векторизованный движок правил (фрагменты кодируются один раз)"""
+        if getattr(self, '_engine', None) is None:
+            self._engine = RuleEngine.from_session(self.session)
+        return self._engine
 
-            if length > 0:
-                gc_percent = (gc_count / length) * 100
-                g_percent = (g_count / length) * 100
-                c_percent = (c_count / length) * 100
-            else:
-                gc_percent = g_percent = c_percent = 0.0
+    """Обработка sense-последовательности"""
 
-            gc_point = 0 if gc_percent < 36 else 0 if gc_percent > 52 else 1
+    def window_coords(self):
+        """Начала (0-based) и длины sense-фрагментов в регионе"""
+        table = self.session.sense_table
+        return table.starts, table.lengths.astype(np.int64)
 
-            results.append({
-                'sequence_id': f"seq_{idx + 1:03d}",
-                'sense': sequence,
-                'length': length,
-                'gc_percent': round(gc_percent, 2),
-                'gc_point': gc_point,
-            })
-        db = pd.DataFrame(results)
+    def analyze_gc(self):
+        """GC content of 36–52%"""
+        starts, lengths = self.window_coords()
+        counts = self.session.editor.composition().counts(starts, lengths)
+        gc_count = counts[:, 1] + counts[:, 2]
+        safe_lengths = np.maximum(lengths, 1)
+        gc_percent = np.where(lengths > 0, gc_count / safe_lengths * 100, 0.0)
+        gc_point = ((gc_percent >= 36) & (gc_percent <= 52)).astype(int)
+
+        db = pd.DataFrame({
+            'sequence_id': [f"seq_{idx + 1:03d}" for idx in range(len(starts))],
+            'sense': self.session.sense_table.sequences(),
+            'length': lengths,
+            'gc_percent': np.round(gc_percent, 2),
+            'gc_point': gc_point,
+        })
         return db
 
     def frequency_gc_at(self):
         """Frequency of GC and AT repeats less than 3 and 4, respectively"""
-        results = []
-        for idx, sequence in enumerate(self.df_sense['sequence']):
-            seq_upper = str(sequence).upper()
-            length = len(seq_upper)
-
-            gc_frequency = 0
-            au_frequency = 0
-
-            # Правильный подсчет со смещением 1
-            for i in range(length - 1):  # -1 потому что берем по 2 символа
-                if seq_upper[i:i + 2] == 'GC':
-                    gc_frequency += 1
-                elif seq_upper[i:i + 2] == 'AU':
-                    au_frequency += 1
-
-            frequency_point = 0 if gc_frequency > 3 else 0 if au_frequency > 4 else 1
-            results.append({
-                'sense': sequence,
-                'gc_frequency': gc_frequency,
-                'au_frequency': au_frequency,
-                'frequency_point': frequency_point
-            })
-        db = pd.DataFrame(results)
+        starts, lengths = self.window_coords()
+        index = self.session.editor.composition()
+        gc_frequency = index.dinucleotide('GC', starts, lengths)
+        au_frequency = index.dinucleotide('AU', starts, lengths)
+        frequency_point = ((gc_frequency <= 3) & (au_frequency <= 4)).astype(int)
+
+        db = pd.DataFrame({
+            'sense': self.session.sense_table.sequences(),
+            'gc_frequency': gc_frequency,
+            'au_frequency': au_frequency,
+            'frequency_point': frequency_point
+        })
         return db
 
     def add_dt_overhangs(self, dt_count=2):
@@ -232,19 +230,7 @@ class analyz_rna:
     """Вывод информации"""
 
     def final_count(self, columns_to_show=None):
-        df1 = self.analyze_gc().add_prefix('m1_')
-        df2 = self.frequency_gc_at().add_prefix('m2_')
-        df3 = self.add_dt_overhangs().add_prefix('m3_')
-        df4 = self.u_at_10().add_prefix('m4_')
-        df5 = self.no_g_at_13().add_prefix('m5_')
-        df6 = self.no_g_c_at_19().add_prefix('m6_')
-        df7 = self.a_at_3_19().add_prefix('m7_')
-        df8 = self.strong_pairing_5_end().add_prefix('m8_')
-        df9 = self.a_at_6().add_prefix('m9_')
-        df10 = self.weak_pairing_5_end().add_prefix('m10_')
-
-
-        general_df = pd.concat([df1, df2, df3, df4, df5, df6, df7, df8, df9,df10], axis=1)
+        general_df = self.engine.combined()
         point_columns = [col for col in general_df.columns if 'point' in col]
         general_df['total_points'] = general_df[point_columns].sum(axis=1)
         if columns_to_show is None:
@@ -259,35 +245,33 @@ class analyz_rna:
         return general_df[available_cols]
 
     def get_combined_data(self, columns_to_show=None):
-        # Получаем DataFrame от всех методов
-        df1 = self.analyze_gc().add_prefix('m1_')
-        df2 = self.frequency_gc_at().add_prefix('m2_')
-        df3 = self.add_dt_overhangs().add_prefix('m3_')
-        df4 = self.u_at_10().add_prefix('m4_')
-        df5 = self.no_g_at_13().add_prefix('m5_')
-        df6 = self.no_g_c_at_19().add_prefix('m6_')
-        df7 = self.a_at_3_19().add_prefix('m7_')
-        df8 = self.strong_pairing_5_end().add_prefix('m8_')
-        df9 = self.a_at_6().add_prefix('m9_')
-        df10 = self.weak_pairing_5_end().add_prefix('m10_')
-
-        combined_df = pd.concat([df1, df2, df3, df4, df5, df6, df7, df8, df9, df10], axis=1)
+        # Все правила считаются за один проход по закодированным фрагментам
+        combined_df = self.engine.combined()
 
         if columns_to_show:
             available_columns = [col for col in columns_to_show if col in combined_df.columns]
             combined_df = combined_df[available_columns]
         return combined_df
 
-
-
-d = analyz_rna()
-# g = d.analyze_gc()
-# c = helper()
-# print(g.to_csv("my_data.csv"))
-# h = d.a_at_6()
-# print(h.to_csv("a_at_6.csv"))
-# h = d.weak_pairing_5_end()
-# print(h.to_csv("weak_pairing_5_end.csv"))
-t = d.get_combined_data()
-# t = d.final_count()
-print(t.to_csv('combined_data.csv'))
\ No newline at end of file
+    def compare_schemes(self, schemes=None):
+        """Баллы по нескольким схемам дизайна siRNA (по столбцу <схема>_total на каждую)"""
+        totals = self.engine.score_schemes(schemes)
+        totals.insert(0, 'sense', self.session.sense_table.sequences())
+        totals.insert(1, 'antisense', self.session.antisense_table.sequences())
+        return totals
+
+
+
+if __name__ == "__main__":
+    d = analyz_rna()
+    # g = d.analyze_gc()
+    # c = helper()
+    # print(g.to_csv("my_data.csv"))
+    # h = d.a_at_6()
+    # print(h.to_csv("a_at_6.csv"))
+    # h = d.weak_pairing_5_end()
+    # print(h.to_csv("weak_pairing_5_end.csv"))
+    t = d.get_combined_data()
+    # t = d.final_count()
+    print(t.to_csv('combined_data.csv'))
+    save_results(t.assign(fragment_id=d.session.sense_table.fragment_ids()), 'analyz_rna')
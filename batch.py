@@ -0,0 +1,84 @@
+import argparse
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+from Bio import SeqIO
+
+from prepare_rna import FragmentSession
+from rule_engine import RuleEngine
+
+
+def read_regions(path):
+    """Таблица регионов: record_id, start, end (срез [start:end], как REGION в prepare_rna)"""
+    df = pd.read_csv(path, sep='\t', comment='#')
+    return {str(row.record_id): (int(row.start), int(row.end)) for row in df.itertuples(index=False)}
+
+
+def score_record(record_id, sequence, region=None, top_n=None, start_size=15, end_size=30):
+    """Нарезка и ранжирование siRNA одного гена (выполняется в процессе пула)"""
+    session = FragmentSession.from_sequence(sequence, region, start_size, end_size)
+    engine = RuleEngine.from_session(session)
+    ranked = engine.score_schemes()
+    ranked.insert(0, 'record_id', record_id)
+    ranked.insert(1, 'fragment_id', session.sense_table.fragment_ids())
+    ranked.insert(2, 'sense', session.sense_table.sequences())
+    ranked.insert(3, 'antisense', session.antisense_table.sequences())
+    ranked['total_points'] = ranked.pop('current_total').astype(int)
+    ranked = ranked.sort_values('total_points', ascending=False, kind='stable')
+    if top_n:
+        ranked = ranked.head(top_n)
+    return record_id, ranked
+
+
+def run_batch(fasta_path, regions_path=None, output='batch_results.csv', workers=None, top_n=None,
+              start_size=15, end_size=30):
+    """Пакетный режим: записи multi-FASTA распределяются по пулу процессов,
+    результаты каждого гена дописываются в output сразу после его завершения"""
+    regions = read_regions(regions_path) if regions_path else {}
+    workers = workers or os.cpu_count() or 1
+    if os.path.exists(output):
+        os.remove(output)
+
+    records = SeqIO.parse(fasta_path, "fasta")
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        def submit_next():
+            record = next(records, None)
+            if record is None:
+                return False
+            if regions and record.id not in regions:
+                print(f"Пропуск {record.id}: нет региона в {regions_path}")
+                return True
+            pending.add(pool.submit(score_record, record.id, str(record.seq), regions.get(record.id),
+                                    top_n, start_size, end_size))
+            return True
+
+        # В очереди не больше 2 записей на процесс: FASTA читается потоково
+        while len(pending) < workers * 2 and submit_next():
+            pass
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record_id, ranked = future.result()
+                ranked.to_csv(output, mode='a', header=written == 0, index=False)
+                written += 1
+                print(f"{record_id}: {len(ranked)} siRNA -> {output}")
+            while len(pending) < workers * 2 and submit_next():
+                pass
+
+    print(f"Обработано генов: {written}")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетный дизайн siRNA для панели генов")
+    parser.add_argument('fasta', help="multi-FASTA с транскриптами")
+    parser.add_argument('--regions', help="TSV с колонками record_id, start, end")
+    parser.add_argument('--output', default='batch_results.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=None, help="сколько лучших siRNA сохранять на ген")
+    args = parser.parse_args()
+    run_batch(args.fasta, args.regions, args.output, args.workers, args.top)
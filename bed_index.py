@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import os
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+BIN_SIZE = 100_000
+# Размер блока файла при индексации (строки блока разбираются pandas за один вызов)
+CHUNK_BYTES = 64 << 20
+BED_COLUMNS = ['chrom', 'start', 'end', 'name', 'score', 'strand']
+
+
+def index_path_for(bed_path):
+    return bed_path + ".bidx.json"
+
+
+def _data_lines(block):
+    """Смещения начал строк блока и маска строк с данными (без #-комментариев, track/browser и пустых)"""
+    array = np.frombuffer(block, dtype=np.uint8)
+    line_starts = np.concatenate([[0], np.flatnonzero(array == ord('\n'))[:-1] + 1])
+    first = array[line_starts]
+    data = ~np.isin(first, np.frombuffer(b'#\r\n \t', dtype=np.uint8))
+    # track/browser - редкие служебные строки, проверяются по префиксу
+    for row in np.flatnonzero(data & np.isin(first, np.frombuffer(b'tb', dtype=np.uint8))):
+        if block.startswith((b'track', b'browser'), int(line_starts[row])):
+            data[row] = False
+    return line_starts, data
+
+
+def _read_blocks(bed_path, chunk_bytes):
+    """Файл блоками целых строк: (смещение блока, байты блока)"""
+    offset = 0
+    tail = b''
+    with open(bed_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            block = tail + chunk
+            cut = block.rfind(b'\n') + 1
+            block, tail = block[:cut], block[cut:]
+            if block:
+                yield offset, block
+                offset += len(block)
+    if tail:
+        yield offset, tail + b'\n'
+
+
+def build_bed_index(bed_path, bin_size=BIN_SIZE, start_column=1, chunk_bytes=CHUNK_BYTES):
+    """Однократная индексация: для каждой хромосомы - смещение первой строки каждого бина.
+    Файл читается блоками, хромосомы и позиции блока разбирает pandas, бины считаются по массивам"""
+    from snp import convert_chromosome_format
+    chroms = {}
+    current = None
+    previous_start = -1
+    for block_offset, block in _read_blocks(bed_path, chunk_bytes):
+        line_starts, data = _data_lines(block)
+        if not data.any():
+            continue
+        if not data.all():
+            block = b''.join(block[start:end] for start, end in
+                             zip(line_starts[data].tolist(), np.append(line_starts[1:], len(block))[data].tolist()))
+        frame = pd.read_csv(io.BytesIO(block), sep='\t', header=None, usecols=[0, start_column],
+                            dtype={0: str}, quoting=csv.QUOTE_NONE)
+        offsets = block_offset + line_starts[data]
+        starts = frame[start_column].to_numpy(dtype=np.int64)
+        # Имена хромосом нормализуются один раз на уникальное значение блока
+        raw = frame[0].astype('category')
+        names = np.asarray([str(convert_chromosome_format(c)) for c in raw.cat.categories], dtype=object)
+        chrom_names = names[raw.cat.codes.to_numpy()]
+        run_starts = np.flatnonzero(np.concatenate([[True], chrom_names[1:] != chrom_names[:-1]]))
+
+        for begin, stop in zip(run_starts.tolist(), np.append(run_starts[1:], len(starts)).tolist()):
+            chrom = chrom_names[begin]
+            if chrom != current:
+                if current is not None:
+                    chroms[current]['end'] = int(offsets[begin])
+                if chrom in chroms:
+                    raise ValueError(f"{bed_path}: строки хромосомы {chrom} идут не подряд, отсортируйте файл")
+                chroms[chrom] = {'bins': [], 'offsets': [], 'end': None}
+                current = chrom
+                previous_start = -1
+            run = starts[begin:stop]
+            unsorted = np.diff(run, prepend=previous_start) < 0
+            if unsorted.any():
+                raise ValueError(f"{bed_path}: файл не отсортирован по позиции ({chrom}:{run[unsorted.argmax()]})")
+            previous_start = int(run[-1])
+            # Первая строка каждого нового бина
+            entry = chroms[chrom]
+            bins = run // bin_size
+            new = np.diff(bins, prepend=entry['bins'][-1] if entry['bins'] else -1) != 0
+            entry['bins'].extend(bins[new].tolist())
+            entry['offsets'].extend(offsets[begin:stop][new].tolist())
+
+    stat = os.stat(bed_path)
+    if current is not None:
+        chroms[current]['end'] = stat.st_size
+    index = {'bin_size': bin_size, 'start_column': start_column, 'size': stat.st_size,
+             'mtime': stat.st_mtime, 'chroms': chroms}
+    with open(index_path_for(bed_path), 'w') as f:
+        json.dump(index, f)
+    print(f"Индекс {index_path_for(bed_path)}: {len(chroms)} хромосом")
+    return index
+
+
+def load_bed_index(bed_path, bin_size=BIN_SIZE, start_column=1):
+    """Индекс из файла рядом с BED; строится заново, если его нет или BED изменился"""
+    path = index_path_for(bed_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            index = json.load(f)
+        stat = os.stat(bed_path)
+        if index['size'] == stat.st_size and index['mtime'] == stat.st_mtime:
+            return index
+    return build_bed_index(bed_path, bin_size, start_column)
+
+
+def region_lines(path, chrom, start, end, index):
+    """Строки хромосомы chrom с позицией в [start, end): seek к нужному бину и чтение до end"""
+    entry = index['chroms'].get(str(chrom))
+    if entry is None or not entry['bins']:
+        return []
+    start_column = index['start_column']
+    first = max(bisect_right(entry['bins'], start // index['bin_size']) - 1, 0)
+    lines = []
+    with open(path, 'rb') as f:
+        f.seek(entry['offsets'][first])
+        position = entry['offsets'][first]
+        while position < entry['end']:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.startswith(b'#'):
+                continue
+            line_start = int(line.split(b'\t', start_column + 1)[start_column])
+            if line_start >= end:
+                break
+            if line_start >= start:
+                lines.append(line)
+    return lines
+
+
+def read_bed_region(bed_path, chrom, start, end, index=None):
+    """Записи BED, начинающиеся в [start, end) на chrom; разбираются только строки региона"""
+    from snp import convert_chromosome_format
+    index = index or load_bed_index(bed_path)
+    lines = region_lines(bed_path, chrom, start, end, index)
+    if not lines:
+        return pd.DataFrame(columns=BED_COLUMNS)
+    df = pd.read_csv(io.BytesIO(b''.join(lines)), sep='\t', header=None)
+    df.columns = BED_COLUMNS[:len(df.columns)]
+    df['chrom'] = df['chrom'].map(convert_chromosome_format)
+    df['start'] = pd.to_numeric(df['start'], errors='coerce')
+    df['end'] = pd.to_numeric(df['end'], errors='coerce')
+    return df
@@ -0,0 +1,133 @@
+import asyncio
+from bisect import bisect_left
+from collections import defaultdict
+
+from blast_cache import BlastCache, search_key, strip_query_id, with_query_id
+from blast_parser import SpecificityAccumulator, TitleTable, iter_hit_chunks, outfmt_fields
+
+READ_SIZE = 1 << 16
+
+
+def fasta_bytes(queries):
+    """FASTA запросов {номер: последовательность} с id seq_N, как в батч-файлах"""
+    return ''.join(f">seq_{query}\n{seq}\n" for query, seq in queries.items()).encode('ascii')
+
+
+async def read_blocks(stream):
+    """Вывод процесса блоками целых строк по мере поступления"""
+    tail = b''
+    while True:
+        block = await stream.read(READ_SIZE)
+        if not block:
+            break
+        block = tail + block
+        cut = block.rfind(b'\n') + 1
+        block, tail = block[:cut], block[cut:]
+        if block:
+            yield block.decode().splitlines(keepends=True)
+    if tail:
+        yield [tail.decode()]
+
+
+class StdinBlast:
+    """run_batch для AdaptiveScheduler.run_async: blastn получает запросы батча через stdin (-query -),
+    совпадения разбираются и пишутся в кэш по мере вывода. Батч-файлы не создаются"""
+    def __init__(self, command, db, cache=None):
+        # command(num_threads, options) -> список аргументов blastn с "-query", "-"
+        self.command = command
+        self.db = db
+        self.cache = cache or BlastCache()
+
+    async def __call__(self, batch_info):
+        sequences = batch_info['sequences']
+        start_idx = batch_info['start_idx']
+        options = batch_info.get('blast_options')
+        progress = batch_info.get('progress') or (lambda n: None)
+        cmd = self.command(batch_info.get('num_threads', 2), options)
+        key = search_key(self.db, cmd)
+        fields = outfmt_fields(cmd)
+
+        seq_ids = {start_idx + idx: seq for idx, seq in enumerate(sequences)}
+        cached = self.cache.get_many(sequences, key)
+        misses = {query: seq for query, seq in seq_ids.items() if seq not in cached}
+        miss_queries = list(misses)
+
+        titles = TitleTable()
+        accumulator = batch_info.get('accumulator') or SpecificityAccumulator(
+            [len(seq) for seq in sequences], start_idx)
+        cached_lines = (line for query, seq in seq_ids.items() if seq in cached
+                        for line in with_query_id(f"seq_{query}", cached[seq]))
+        for _, hits in iter_hit_chunks(cached_lines, titles, fields=fields):
+            accumulator.add(hits, titles)
+        progress(len(sequences) - len(misses))
+
+        def batch_result(status, stderr=''):
+            summary = accumulator.summary(titles)
+            return {
+                'batch_num': batch_info['batch_num'],
+                'summary': summary,
+                'status': status,
+                'total_sequences': len(sequences),
+                'matches_found': int((summary['hits_count'] > 0).sum()),
+                'cached': len(sequences) - len(misses),
+                'stderr': stderr
+            }
+
+        if not misses:
+            return batch_result('success')
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except Exception as e:
+            # blastn не найден или не запускается: ошибка батча, а не всего прогона
+            return batch_result(f'error: {str(e)}')
+
+        async def feed():
+            try:
+                process.stdin.write(fasta_bytes(misses))
+                await process.stdin.drain()
+                process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # blastn завершился раньше - причина будет в stderr и коде возврата
+
+        pending = defaultdict(list)
+        flushed = set()
+        done_count = [0]
+
+        async def collect():
+            async for lines in read_blocks(process.stdout):
+                for raw, hits in iter_hit_chunks(lines, titles, fields=fields):
+                    accumulator.add(hits, titles)
+                    queries = hits['query'].tolist()
+                    for query, line in zip(queries, raw):
+                        pending[query].append(strip_query_id(line.rstrip('\n')))
+                    # blastn выводит совпадения запроса подряд: все запросы до последнего завершены
+                    done = [query for query in pending if query != queries[-1]]
+                    flushed.update(done)
+                    self.cache.put_many({seq_ids[query]: pending.pop(query) for query in done}, key)
+                    completed = bisect_left(miss_queries, queries[-1])
+                    progress(completed - done_count[0])
+                    done_count[0] = completed
+            return await process.wait()
+
+        feeder = asyncio.create_task(feed())
+        errors = asyncio.create_task(process.stderr.read())
+        try:
+            returncode = await asyncio.wait_for(collect(), batch_info.get('timeout', 300))  # по умолчанию 5 минут
+        except Exception as e:
+            process.kill()
+            await process.wait()
+            status = 'timeout' if isinstance(e, asyncio.TimeoutError) else f'error: {str(e)}'
+            return batch_result(status, (await errors).decode())
+        finally:
+            await feeder
+        stderr = (await errors).decode()
+
+        if returncode != 0:
+            return batch_result(f'error: blastn завершился с кодом {returncode}', stderr)
+        # В кэш попадают только успешные запуски, включая последовательности без совпадений
+        self.cache.put_many({seq: pending.get(query, []) for query, seq in misses.items() if query not in flushed},
+                            key)
+        progress(len(misses) - done_count[0])
+        return batch_result('success', stderr)
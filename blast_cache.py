@@ -0,0 +1,86 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+
+CACHE_PATH = "blast_cache.sqlite"
+# Опции, не влияющие на результат поиска, в ключ не входят
+IGNORED_OPTIONS = ("-query", "-out", "-num_threads")
+
+
+def database_fingerprint(db):
+    """Идентичность BLAST базы: путь и размер/mtime всех ее файлов (.nin, .nsq, .nal, ...)"""
+    files = sorted(glob.glob(db + ".*"))
+    stats = [(os.path.basename(f), os.path.getsize(f), int(os.path.getmtime(f))) for f in files]
+    return {'db': os.path.abspath(db), 'files': stats}
+
+
+def search_key(db, cmd):
+    """Ключ набора параметров: база + опции blastn без -query/-out/-num_threads"""
+    options = []
+    args = list(cmd[1:])
+    i = 0
+    while i < len(args):
+        if args[i] in IGNORED_OPTIONS:
+            i += 2
+            continue
+        if args[i] == "-db":
+            i += 2
+            continue
+        options.append(args[i])
+        i += 1
+    payload = json.dumps({'db': database_fingerprint(db), 'program': cmd[0], 'options': options}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BlastCache:
+    """Результаты BLAST по последовательностям в SQLite: (ключ параметров, последовательность) -> строки outfmt 6.
+    Строки хранятся без qseqid, пустой список - последовательность без совпадений"""
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS hits ("
+                       "search_key TEXT NOT NULL, sequence TEXT NOT NULL, lines TEXT NOT NULL, "
+                       "PRIMARY KEY (search_key, sequence))")
+
+    @contextmanager
+    def _connect(self):
+        # Отдельное соединение на вызов: кэш используется из процессов пула. Транзакция
+        # фиксируется (или откатывается), затем соединение закрывается
+        with closing(sqlite3.connect(self.path, timeout=60)) as db, db:
+            yield db
+
+    def get_many(self, sequences, key):
+        """{последовательность: [строки без qseqid]} для найденных в кэше"""
+        found = {}
+        sequences = list(sequences)
+        with self._connect() as db:
+            for i in range(0, len(sequences), 500):
+                chunk = sequences[i:i + 500]
+                rows = db.execute(
+                    f"SELECT sequence, lines FROM hits WHERE search_key = ? AND sequence IN ({','.join('?' * len(chunk))})",
+                    [key, *chunk])
+                for sequence, lines in rows:
+                    found[sequence] = lines.split('\n') if lines else []
+        return found
+
+    def put_many(self, results, key):
+        """results: {последовательность: [строки без qseqid]}"""
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO hits (search_key, sequence, lines) VALUES (?, ?, ?)",
+                           [(key, sequence, '\n'.join(lines)) for sequence, lines in results.items()])
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM hits").fetchone()[0]
+
+
+def strip_query_id(line):
+    return line.split('\t', 1)[1]
+
+
+def with_query_id(seq_id, lines):
+    return [f"{seq_id}\t{line}" for line in lines]
@@ -0,0 +1,118 @@
+import csv
+import io
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+# Столбцы -outfmt 6 в BLAST.blast_command
+OUTFMT_FIELDS = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen',
+                 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore', 'stitle']
+FIELD_TYPES = {'qseqid': str, 'sseqid': str, 'pident': np.float64, 'length': np.int32, 'mismatch': np.int32,
+               'gapopen': np.int32, 'qstart': np.int32, 'qend': np.int32, 'sstart': np.int64, 'send': np.int64,
+               'evalue': np.float64, 'bitscore': np.float64, 'stitle': str, 'btop': str}
+CHUNK_ROWS = 200_000
+
+
+class TitleTable:
+    """Интернирование названий субъектов: в записях хранится код, название - один раз"""
+    def __init__(self):
+        self.titles = []
+        self._codes = {}
+
+    def codes(self, values):
+        categorical = pd.Categorical(values)
+        mapping = np.fromiter((self._code(t) for t in categorical.categories), dtype=np.int32,
+                              count=len(categorical.categories))
+        return mapping[categorical.codes]
+
+    def _code(self, title):
+        code = self._codes.get(title)
+        if code is None:
+            code = self._codes[title] = len(self.titles)
+            self.titles.append(title)
+        return code
+
+
+def outfmt_fields(cmd):
+    """Столбцы из аргумента -outfmt команды blastn ("6 qseqid ...")"""
+    return cmd[cmd.index("-outfmt") + 1].split()[1:]
+
+
+def parse_hits(text, titles, fields=OUTFMT_FIELDS):
+    """Типизированные столбцы для фрагмента вывода outfmt 6: query (номер из seq_N), числа, код stitle"""
+    frame = pd.read_csv(io.StringIO(text), sep='\t', header=None, names=fields,
+                        dtype={field: FIELD_TYPES.get(field, str) for field in fields},
+                        quoting=csv.QUOTE_NONE, keep_default_na=False, na_filter=False)
+    frame.insert(0, 'query', frame.pop('qseqid').str.rsplit('_', n=1).str[-1].astype(np.int64))
+    frame['stitle'] = titles.codes(frame['stitle'].to_numpy())
+    return frame
+
+
+def iter_hit_chunks(lines, titles, chunk_rows=CHUNK_ROWS, fields=OUTFMT_FIELDS):
+    """Поток строк blastn -> порции (сырые строки, типизированные записи); память ограничена порцией"""
+    lines = (line for line in lines if line.strip() and not line.startswith('#'))
+    while True:
+        chunk = list(islice(lines, chunk_rows))
+        if not chunk:
+            return
+        yield chunk, parse_hits(''.join(line if line.endswith('\n') else line + '\n' for line in chunk), titles,
+                                fields)
+
+
+class SpecificityAccumulator:
+    """Специфичность запросов батча по потоку записей, по массивам:
+    неспецифичен запрос, у которого есть совпадение не с target с покрытием и идентичностью выше порогов"""
+    def __init__(self, query_lengths, query_offset=0, target="ATXN1", min_coverage=70, min_pident=70):
+        self.query_lengths = np.asarray(query_lengths, dtype=np.float64)
+        self.query_offset = query_offset
+        self.target = target.upper()
+        self.min_coverage = min_coverage
+        self.min_pident = min_pident
+        self.hits_count = np.zeros(len(self.query_lengths), dtype=np.int64)
+        # Первое совпадение, делающее запрос неспецифичным: код названия, покрытие, идентичность
+        self.bad_title = np.full(len(self.query_lengths), -1, dtype=np.int64)
+        self.bad_coverage = np.zeros(len(self.query_lengths))
+        self.bad_pident = np.zeros(len(self.query_lengths))
+        self._offtarget = np.zeros(0, dtype=bool)
+
+    def _offtarget_titles(self, titles):
+        # Проверка названия делается один раз на интернированное название
+        known = len(self._offtarget)
+        if known < len(titles.titles):
+            extra = [self.target not in t.upper() for t in titles.titles[known:]]
+            self._offtarget = np.concatenate([self._offtarget, np.asarray(extra, dtype=bool)])
+        return self._offtarget
+
+    def add(self, hits, titles):
+        query = hits['query'].to_numpy() - self.query_offset
+        self.hits_count += np.bincount(query, minlength=len(self.hits_count))
+        title = hits['stitle'].to_numpy()
+        pident = hits['pident'].to_numpy()
+        coverage = hits['length'].to_numpy() / self.query_lengths[query] * 100
+        bad = self._offtarget_titles(titles)[title] & (coverage > self.min_coverage) & (pident > self.min_pident)
+        first_queries, rows = self._first_bad(query, bad)
+        self.bad_title[first_queries] = title[rows]
+        self.bad_coverage[first_queries] = coverage[rows]
+        self.bad_pident[first_queries] = pident[rows]
+
+    def _first_bad(self, query, bad):
+        """Запросы, впервые ставшие неспецифичными, и строки их первых плохих совпадений"""
+        rows = np.flatnonzero(bad)
+        first_queries, first = np.unique(query[rows], return_index=True)
+        rows = rows[first]
+        new = self.bad_title[first_queries] < 0
+        return first_queries[new], rows[new]
+
+    def _reason(self, q, titles):
+        return (f"Match to {titles.titles[self.bad_title[q]]} "
+                f"({self.bad_coverage[q]:.1f}%, {self.bad_pident[q]:.1f}% id)")
+
+    def summary(self, titles):
+        """specific, reason, hits_count по запросам батча (индекс - номера запросов с учетом query_offset)"""
+        specific = self.bad_title < 0
+        reason = np.where(self.hits_count == 0, "No hits", "Specific").astype(object)
+        for q in np.flatnonzero(~specific):
+            reason[q] = self._reason(q, titles)
+        return pd.DataFrame({'specific': specific, 'reason': reason, 'hits_count': self.hits_count},
+                            index=np.arange(len(specific)) + self.query_offset)
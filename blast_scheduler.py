@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from tqdm import tqdm
+
+# На коротких запросах blastn-short плохо масштабируется по потокам: выгоднее больше процессов
+MAX_THREADS = 2
+
+
+def available_cores():
+    """Ядра, доступные процессу (с учетом affinity/cgroup, если ОС это сообщает)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def plan_resources(cores=None, max_threads=MAX_THREADS):
+    """(процессы, потоки blastn) так, чтобы процессы x потоки = числу ядер"""
+    cores = cores or available_cores()
+    threads = 1 if cores <= 4 else min(max_threads, cores)
+    return max(1, cores // threads), threads
+
+
+class AdaptiveScheduler:
+    """Очередь диапазонов последовательностей [start, end) для одновременных запусков blastn:
+    размер батча подбирается по измеренной скорости (сек/последовательность) под target_seconds,
+    к концу прогона батчи уменьшаются, батчи с таймаутом делятся пополам и возвращаются в очередь"""
+    def __init__(self, n_sequences, make_batch, run_batch, workers=None, threads=None, initial_batch=200,
+                 min_batch=10, max_batch=5000, target_seconds=60, timeout=300, on_result=None):
+        planned_workers, planned_threads = plan_resources()
+        self.workers = workers or planned_workers
+        self.threads = threads or planned_threads
+        self.make_batch = make_batch
+        self.run_batch = run_batch
+        self.n_sequences = n_sequences
+        self.initial_batch = initial_batch
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        # Батч должен заметно укладываться в таймаут
+        self.target_seconds = min(target_seconds, timeout / 3)
+        self.timeout = timeout
+        self.seconds_per_sequence = None
+        self.splits = 0
+        # Вызывается для каждого принятого результата батча (например, для промежуточных оценок)
+        self.on_result = on_result
+
+    def batch_size(self, remaining):
+        if self.seconds_per_sequence is None:
+            size = self.initial_batch
+        else:
+            size = int(self.target_seconds / max(self.seconds_per_sequence, 1e-6))
+        # Хвост: на каждый процесс остается хотя бы два батча, чтобы не ждать одного отстающего
+        tail = -(-remaining // (2 * self.workers))
+        return max(self.min_batch, min(size, self.max_batch, tail))
+
+    def _observe(self, sequences, elapsed):
+        rate = elapsed / max(sequences, 1)
+        self.seconds_per_sequence = rate if self.seconds_per_sequence is None else (
+            0.7 * self.seconds_per_sequence + 0.3 * rate)
+
+    def _take(self, pending):
+        """Следующий батч из начала очереди: диапазон урезается до текущего размера батча"""
+        start, end = pending.popleft()
+        size = self.batch_size(self.remaining)
+        if end - start > size:
+            pending.appendleft((start + size, end))
+            end = start + size
+        self.remaining -= end - start
+        batch = self.make_batch(start, end, self.batch_num)
+        batch.update(num_threads=self.threads, timeout=self.timeout)
+        self.batch_num += 1
+        return start, end, batch
+
+    def _complete(self, pending, start, end, submitted, result):
+        """Учет завершенного батча; False - батч с таймаутом разделен и возвращен в очередь"""
+        if result['status'] == 'timeout' and end - start > self.min_batch:
+            # Батч не теряется: половины идут в начало очереди
+            middle = (start + end) // 2
+            pending.appendleft((middle, end))
+            pending.appendleft((start, middle))
+            self.remaining += end - start
+            self.splits += 1
+            return False
+        if result['status'] == 'success':
+            blasted = end - start - result.get('cached', 0)
+            if blasted > 0:
+                self._observe(blasted, time.monotonic() - submitted)
+        if self.on_result:
+            self.on_result(result)
+        return True
+
+    def _start(self):
+        self.remaining = self.n_sequences
+        self.batch_num = 0
+        print(f" АДАПТИВНЫЙ BLAST: {self.workers} процессов x {self.threads} потоков")
+        return deque([(0, self.n_sequences)]) if self.n_sequences else deque()
+
+    def _finish(self):
+        if self.splits:
+            print(f"   Разделено батчей после таймаута: {self.splits}")
+
+    async def run_async(self):
+        """Прогон в одном процессе asyncio: run_batch - корутина, число одновременных blastn
+        ограничено семафором, прогресс (скорость и ETA) обновляется по мере завершения запросов"""
+        pending = self._start()
+        results = []
+        slots = asyncio.Semaphore(self.workers)
+        with tqdm(total=self.n_sequences, desc="BLAST обработка", unit="seq") as progress:
+            in_flight = {}
+            while pending or in_flight:
+                while pending and not slots.locked():
+                    await slots.acquire()
+                    start, end, batch = self._take(pending)
+                    # Батч сообщает о завершенных запросах сам; при делении после таймаута отчет откатывается
+                    reported = [0]
+
+                    def report(n, reported=reported):
+                        reported[0] += n
+                        progress.update(n)
+                    batch['progress'] = report
+                    task = asyncio.create_task(self.run_batch(batch))
+                    task.add_done_callback(lambda _: slots.release())
+                    in_flight[task] = (start, end, time.monotonic(), reported)
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    start, end, submitted, reported = in_flight.pop(task)
+                    if self._complete(pending, start, end, submitted, task.result()):
+                        results.append(task.result())
+                        progress.update(end - start - reported[0])
+                    else:
+                        progress.update(-reported[0])
+        self._finish()
+        return results
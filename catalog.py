@@ -0,0 +1,84 @@
+from collections import defaultdict
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+class FragmentCatalog:
+    """Пары siRNA с хэш-индексами: по fragment_id, по последовательности и по партнеру другой цепи.
+    Строка i - пара (sense, antisense) с общим fragment_id"""
+    def __init__(self, fragment_ids, sense, antisense, size_nt=None):
+        self.fragment_ids = np.asarray(fragment_ids, dtype=object)
+        self.sense_sequences = list(sense)
+        self.antisense_sequences = list(antisense)
+        self.size_nt = None if size_nt is None else np.asarray(size_nt, dtype=np.int64)
+
+    @classmethod
+    def from_tables(cls, sense_table, antisense_table):
+        """Каталог из FragmentTable: antisense-гид каждой пары находится через partner"""
+        antisense = antisense_table.sequences()
+        rows = np.empty(len(antisense_table), dtype=np.int64)
+        rows[antisense_table.partner] = np.arange(len(antisense_table))
+        return cls(sense_table.fragment_ids(), sense_table.sequences(), [antisense[r] for r in rows],
+                   sense_table.lengths)
+
+    @classmethod
+    def from_frames(cls, df_sense, df_antisense):
+        """Каталог из DataFrame с fragment_id; пары сопоставляются по id, а не по порядку строк"""
+        partner = pd.Index(df_antisense['fragment_id']).get_indexer(df_sense['fragment_id'])
+        paired = partner >= 0
+        return cls(df_sense['fragment_id'].to_numpy()[paired], df_sense['sequence'].to_numpy()[paired],
+                   df_antisense['sequence'].to_numpy()[partner[paired]],
+                   df_sense['size_nt'].to_numpy()[paired] if 'size_nt' in df_sense else None)
+
+    def __len__(self):
+        return len(self.fragment_ids)
+
+    def __contains__(self, fragment_id):
+        return fragment_id in self._rows
+
+    @cached_property
+    def _rows(self):
+        return {fragment_id: row for row, fragment_id in enumerate(self.fragment_ids)}
+
+    @cached_property
+    def by_sequence(self):
+        """{последовательность: [(цепь, fragment_id), ...]} - одна последовательность может встречаться в разных парах"""
+        index = defaultdict(list)
+        for strand, sequences in (('sense', self.sense_sequences), ('antisense', self.antisense_sequences)):
+            for fragment_id, sequence in zip(self.fragment_ids, sequences):
+                index[sequence].append((strand, fragment_id))
+        return dict(index)
+
+    def row(self, fragment_id):
+        row = self._rows.get(fragment_id)
+        if row is None:
+            raise KeyError(f"Фрагмент {fragment_id} не найден")
+        return row
+
+    def rows(self, fragment_ids):
+        """Номера строк для массива id за один проход (-1 для отсутствующих)"""
+        return pd.Index(self.fragment_ids).get_indexer(list(fragment_ids))
+
+    def sense(self, fragment_id):
+        return self.sense_sequences[self.row(fragment_id)]
+
+    def antisense(self, fragment_id):
+        return self.antisense_sequences[self.row(fragment_id)]
+
+    def pair(self, fragment_id):
+        row = self.row(fragment_id)
+        return self.sense_sequences[row], self.antisense_sequences[row]
+
+    def partner(self, sequence, strand='sense'):
+        """Последовательности другой цепи для всех пар, где sequence стоит на цепи strand"""
+        other = self.antisense_sequences if strand == 'sense' else self.sense_sequences
+        return [other[self._rows[fragment_id]] for s, fragment_id in self.by_sequence.get(sequence, [])
+                if s == strand]
+
+    def find(self, sequence):
+        return self.by_sequence.get(sequence, [])
+
+    def unique_sequences(self):
+        return list(self.by_sequence)
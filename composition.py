@@ -0,0 +1,54 @@
+import numpy as np
+
+BASES = 'ACGU'
+DINUCLEOTIDES = tuple(a + b for a in BASES for b in BASES)
+
+# Таблица перекодировки ASCII -> 0..3 (A, C, G, U/T), остальные символы -> 4
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(('Aa', 'Cc', 'Gg', 'UuTt')):
+    for _base in _bases:
+        _CODES[ord(_base)] = _code
+
+
+class CompositionIndex:
+    """Префиксные суммы нуклеотидов и динуклеотидов региона: состав любого окна за два обращения"""
+    def __init__(self, region):
+        # Байтовый буфер (как у FragmentTable) берется как есть; str и Bio.Seq - через str()
+        raw = bytes(region) if isinstance(region, (bytes, bytearray, memoryview)) else str(region).encode('ascii')
+        codes = _CODES[np.frombuffer(raw, dtype=np.uint8)]
+        self.length = len(codes)
+
+        self.mono = np.zeros((self.length + 1, 4), dtype=np.int32)
+        for code in range(4):
+            self.mono[1:, code] = np.cumsum(codes == code)
+
+        # di[i] - число динуклеотидов, начинающихся в позициях < i
+        pair = codes[:-1].astype(np.int16) * 4 + codes[1:]
+        valid = (codes[:-1] < 4) & (codes[1:] < 4)
+        self.di = np.zeros((max(self.length, 1), 16), dtype=np.int32)
+        for code in range(16):
+            self.di[1:, code] = np.cumsum(valid & (pair == code))
+
+    def counts(self, starts, lengths):
+        """Число A, C, G, U в окнах [start, start + length) -> массив k x 4"""
+        starts = np.asarray(starts)
+        return self.mono[starts + np.asarray(lengths)] - self.mono[starts]
+
+    def dinucleotide_counts(self, starts, lengths):
+        """Полный динуклеотидный профиль окон -> массив k x 16 (порядок DINUCLEOTIDES)"""
+        starts = np.asarray(starts)
+        ends = np.maximum(starts + np.asarray(lengths) - 1, starts)
+        return self.di[ends] - self.di[starts]
+
+    def dinucleotide(self, dinucleotide, starts, lengths):
+        """Число вхождений одного динуклеотида (например 'GC') в окна"""
+        column = DINUCLEOTIDES.index(dinucleotide.upper().replace('T', 'U'))
+        starts = np.asarray(starts)
+        ends = np.maximum(starts + np.asarray(lengths) - 1, starts)
+        return self.di[ends, column] - self.di[starts, column]
+
+    def gc_percent(self, starts, lengths):
+        """GC-состав окон в процентах"""
+        counts = self.counts(starts, lengths)
+        lengths = np.asarray(lengths)
+        return np.where(lengths > 0, (counts[:, 1] + counts[:, 2]) / np.maximum(lengths, 1) * 100, 0.0)
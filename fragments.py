@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class FragmentTable:
+    """Компактная таблица фрагментов: общий байтовый буфер цепи и массивы (start, length)"""
+    def __init__(self, buffer, starts, lengths, id_starts=None, partner=None):
+        self.buffer = bytes(buffer)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.lengths = np.asarray(lengths, dtype=np.int16)
+        # Начала, по которым строится fragment_id (по умолчанию совпадают со starts)
+        self.id_starts = self.starts if id_starts is None else np.asarray(id_starts, dtype=np.int32)
+        # Номер строки парного фрагмента другой цепи (для antisense-гидов)
+        self.partner = None if partner is None else np.asarray(partner, dtype=np.int32)
+
+    @classmethod
+    def tile(cls, region, start_size=15, end_size=30):
+        """Все окна длиной start_size..end_size с шагом 1, в порядке editor_rna.sense"""
+        buffer = region.encode('ascii') if isinstance(region, str) else bytes(region)
+        sizes = np.arange(start_size, end_size + 1)
+        counts = np.maximum(len(buffer) - sizes + 1, 0)
+        lengths = np.repeat(sizes, counts)
+        starts = np.concatenate([np.arange(count) for count in counts]) if counts.sum() else np.zeros(0)
+        return cls(buffer, starts, lengths)
+
+    @classmethod
+    def iter_tiles(cls, region, start_size=15, end_size=30, chunk_size=100_000):
+        """То же, что tile, но порциями не больше chunk_size строк - полный список окон не создается"""
+        buffer = region.encode('ascii') if isinstance(region, str) else bytes(region)
+        for size in range(start_size, end_size + 1):
+            count = max(len(buffer) - size + 1, 0)
+            for offset in range(0, count, chunk_size):
+                starts = np.arange(offset, min(offset + chunk_size, count))
+                yield cls(buffer, starts, np.full(len(starts), size))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, rows):
+        """Подтаблица по срезу, маске или массиву индексов (буфер не копируется)"""
+        partner = None if self.partner is None else self.partner[rows]
+        return FragmentTable(self.buffer, self.starts[rows], self.lengths[rows], self.id_starts[rows], partner)
+
+    @property
+    def nbytes(self):
+        """Объем памяти, занимаемый таблицей"""
+        return len(self.buffer) + self.starts.nbytes + self.lengths.nbytes + (
+            0 if self.id_starts is self.starts else self.id_starts.nbytes) + (
+            0 if self.partner is None else self.partner.nbytes)
+
+    def sequence(self, row):
+        start = int(self.starts[row])
+        return self.buffer[start:start + int(self.lengths[row])].decode('ascii')
+
+    def sequences(self):
+        """Строки фрагментов (создаются только по запросу)"""
+        buffer = self.buffer.decode('ascii')
+        return [buffer[start:start + length]
+                for start, length in zip(self.starts.tolist(), self.lengths.tolist())]
+
+    def fragment_id(self, row):
+        return f"{int(self.lengths[row])}_{int(self.id_starts[row]) + 1}"
+
+    def fragment_ids(self):
+        return [f"{length}_{start + 1}"
+                for length, start in zip(self.lengths.tolist(), self.id_starts.tolist())]
+
+    def length_groups(self):
+        """{длина: (номера строк, матрица uint8 n x длина)}. Если начала окон длины идут подряд
+        с шагом 1 или -1 (sense- и antisense-таблицы сессии), матрица - представление буфера
+        без копирования; иначе - копия"""
+        array = np.frombuffer(self.buffer, dtype=np.uint8)
+        groups = {}
+        for length in np.unique(self.lengths):
+            rows = np.flatnonzero(self.lengths == length)
+            windows = sliding_window_view(array, int(length))
+            starts = self.starts[rows]
+            step = np.diff(starts)
+            if len(starts) and (step == 1).all():
+                groups[int(length)] = (rows, windows[int(starts[0]):int(starts[0]) + len(starts)])
+            elif len(starts) and (step == -1).all():
+                groups[int(length)] = (rows, windows[int(starts[-1]):int(starts[-1]) + len(starts)][::-1])
+            else:
+                groups[int(length)] = (rows, windows[starts])
+        return groups
+
+    def to_frame(self):
+        """DataFrame в прежнем формате (fragment_id, size_nt, sequence, sequence_length)"""
+        return pd.DataFrame({
+            'fragment_id': self.fragment_ids(),
+            'size_nt': self.lengths.astype(np.int64),
+            'sequence': self.sequences(),
+            'sequence_length': self.lengths.astype(np.int64),
+        })
@@ -0,0 +1,134 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from blast_parser import SpecificityAccumulator
+
+# Для тайлов нужен btop (позиции замен и гэпов) и мягкие фильтры HSP: окно 15 нт занимает
+# половину 30-мера, а совпадение окна может лежать внутри HSP с меньшей общей идентичностью
+NESTED_OPTIONS = {
+    "-outfmt": "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore stitle btop",
+    "-num_alignments": "50",
+    "-max_hsps": "10",
+    "-perc_identity": "50",
+    "-qcov_hsp_perc": "30",
+}
+# Фильтры исходного запуска blastn (-qcov_hsp_perc, -perc_identity), применяемые к проекции на окно
+WINDOW_MIN_QCOV = 50
+WINDOW_MIN_PIDENT = 70
+BTOP_TOKEN = re.compile(r'(\d+)|(..)')
+
+
+def maximal_tiles(region_length, end_size=30, tile_length=None):
+    """Начала тайлов длины tile_length с шагом tile_length - end_size + 1:
+    любое окно не длиннее end_size целиком лежит в одном тайле"""
+    tile_length = tile_length or end_size
+    if region_length <= tile_length:
+        return np.zeros(1, dtype=np.int64), region_length
+    step = tile_length - end_size + 1
+    starts = np.arange(0, region_length - tile_length + 1, step)
+    if starts[-1] != region_length - tile_length:
+        starts = np.append(starts, region_length - tile_length)
+    return starts.astype(np.int64), tile_length
+
+
+def assign_windows(starts, lengths, tile_starts, tile_length):
+    """Номер тайла для каждого окна [start, start + length): последний тайл, начинающийся не позже окна"""
+    starts = np.asarray(starts, dtype=np.int64)
+    tiles = np.searchsorted(tile_starts, starts, side='right') - 1
+    if ((starts + np.asarray(lengths) > tile_starts[tiles] + tile_length) | (tiles < 0)).any():
+        raise ValueError("Окно не помещается в тайл: увеличьте tile_length или уменьшите шаг")
+    return tiles
+
+
+def btop_profile(btop, qstart, tile_length):
+    """Столбцы выравнивания и совпадения по позициям запроса (тайла) из строки BTOP.
+    Гэп в запросе относится к следующей позиции запроса"""
+    columns = np.zeros(tile_length, dtype=np.int32)
+    matches = np.zeros(tile_length, dtype=np.int32)
+    q = qstart - 1
+    for run, pair in BTOP_TOKEN.findall(btop):
+        if run:
+            n = int(run)
+            columns[q:q + n] += 1
+            matches[q:q + n] += 1
+            q += n
+        elif pair[0] == '-':
+            columns[min(q, tile_length - 1)] += 1
+        else:
+            columns[min(q, tile_length - 1)] += 1
+            q += 1
+    return columns, matches
+
+
+class NestedAccumulator:
+    """Накопитель для батча тайлов: каждое совпадение тайла проецируется на вложенные окна
+    (столбцы и совпадения внутри окна по BTOP), затем работает обычное правило SpecificityAccumulator"""
+    def __init__(self, tile_rows, tile_starts, tile_length, window_rows, window_starts, window_lengths, **rules):
+        # tile_rows - глобальные номера тайлов батча (совпадают с seq_N), окна - строки каталога
+        self.tile_length = tile_length
+        self.window_rows = np.asarray(window_rows, dtype=np.int64)
+        tile_position = {tile: i for i, tile in enumerate(tile_rows)}
+        window_tiles = np.asarray([tile_position[t] for t in assign_windows(
+            window_starts, window_lengths, tile_starts, tile_length)], dtype=np.int64)
+        order = np.argsort(window_tiles, kind='stable')
+        self._windows = order
+        self._window_offset = (np.asarray(window_starts, dtype=np.int64) - np.asarray(tile_starts)[
+            np.asarray(tile_rows)][window_tiles])
+        self._window_lengths = np.asarray(window_lengths, dtype=np.int64)
+        counts = np.bincount(window_tiles, minlength=len(tile_rows))
+        self._tile_bounds = np.concatenate([[0], np.cumsum(counts)])
+        self._tile_position = tile_position
+        self.inner = SpecificityAccumulator(self._window_lengths, **rules)
+
+    def add(self, hits, titles):
+        if hits.empty:
+            return
+        tiles = np.asarray([self._tile_position[t] for t in hits['query'].tolist()], dtype=np.int64)
+        profiles = [btop_profile(b, q, self.tile_length) for b, q in zip(hits['btop'], hits['qstart'])]
+        columns = np.concatenate([np.zeros((len(hits), 1), dtype=np.int64),
+                                  np.cumsum([c for c, _ in profiles], axis=1)], axis=1)
+        matches = np.concatenate([np.zeros((len(hits), 1), dtype=np.int64),
+                                  np.cumsum([m for _, m in profiles], axis=1)], axis=1)
+
+        # Пары (совпадение, окно его тайла)
+        counts = self._tile_bounds[tiles + 1] - self._tile_bounds[tiles]
+        hit = np.repeat(np.arange(len(hits)), counts)
+        window = self._windows[np.repeat(self._tile_bounds[tiles], counts) + (
+            np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))]
+        lo = self._window_offset[window]
+        hi = lo + self._window_lengths[window]
+        window_columns = columns[hit, hi] - columns[hit, lo]
+        window_matches = matches[hit, hi] - matches[hit, lo]
+
+        pident = np.divide(window_matches * 100.0, window_columns, out=np.zeros(len(hit)), where=window_columns > 0)
+        keep = ((window_columns * 100.0 / self._window_lengths[window] >= WINDOW_MIN_QCOV) &
+                (pident >= WINDOW_MIN_PIDENT))
+        self.inner.add(pd.DataFrame({
+            'query': window[keep],
+            'pident': pident[keep],
+            'length': window_columns[keep],
+            'stitle': hits['stitle'].to_numpy()[hit[keep]],
+        }), titles)
+
+    def summary(self, titles):
+        """Итог по окнам; индекс - строки каталога"""
+        summary = self.inner.summary(titles)
+        summary.index = self.window_rows
+        return summary
+
+
+def nested_batches(sense_table, tile_sequences, tile_starts, tile_length):
+    """Фабрика make_batch для AdaptiveScheduler: батч тайлов [start, end) вместе с его окнами"""
+    window_tiles = assign_windows(sense_table.starts, sense_table.lengths, tile_starts, tile_length)
+
+    def make_batch(start, end, batch_num):
+        batch = {'sequences': tile_sequences[start:end], 'start_idx': start, 'batch_num': batch_num}
+        rows = np.flatnonzero((window_tiles >= start) & (window_tiles < end))
+        batch['blast_options'] = NESTED_OPTIONS
+        batch['accumulator'] = NestedAccumulator(
+            np.arange(start, end), tile_starts, tile_length, rows,
+            sense_table.starts[rows], sense_table.lengths[rows])
+        return batch
+    return make_batch
@@ -0,0 +1,214 @@
+import json
+import os
+from itertools import combinations, product
+
+import numpy as np
+import pandas as pd
+
+from snp_cache import is_fresh, source_fingerprint
+
+MANIFEST = "manifest.json"
+KMER_SIZE = 12
+MAX_MISMATCHES = 2
+# Сколько запросов проверяется за один векторный проход (ограничивает память на кандидатов)
+QUERY_CHUNK = 256
+# 2-битный код: A=0, C=1, G=2, T/U=3; все прочее (N, разделители транскриптов) - 4
+SEPARATOR = 4
+ENCODE = bytes(dict(zip(b'ACGTUacgtu', (0, 1, 2, 3, 3, 0, 1, 2, 3, 3))).get(c, SEPARATOR) for c in range(256))
+
+
+def encode(sequence):
+    """Последовательность (ДНК или РНК) -> uint8 коды 0..3, прочие символы -> 4"""
+    raw = sequence.encode('ascii') if isinstance(sequence, str) else sequence
+    return np.frombuffer(raw.translate(ENCODE), dtype=np.uint8)
+
+
+def pack_kmers(codes, k):
+    """Упакованные 2-битные k-меры всех позиций codes и маска k-меров без N/разделителей"""
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool)
+    kmers = np.zeros(n, dtype=np.uint32)
+    bad = np.zeros(n, dtype=bool)
+    for i in range(k):
+        window = codes[i:i + n]
+        kmers = (kmers << 2) | (window & 3)
+        bad |= window == SEPARATOR
+    return kmers, ~bad
+
+
+def mismatch_masks(k, radius):
+    """XOR-маски всех замен не более чем radius оснований k-мера (каждая замена - цифра 1..3 в 2 битах)"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(k), r):
+            for digits in product((1, 2, 3), repeat=r):
+                masks.append(sum(d << (2 * (k - 1 - p)) for p, d in zip(positions, digits)))
+    return np.asarray(masks, dtype=np.uint32)
+
+
+def searchable_codes(codes):
+    """Маска строк (запросов) без N и прочих оснований вне ACGU"""
+    return (codes != SEPARATOR).all(axis=-1)
+
+
+def searchable(sequences):
+    """Маска последовательностей, которые можно искать по индексу (только ACGU/ACGT)"""
+    return np.fromiter((searchable_codes(encode(seq)) for seq in sequences), dtype=bool)
+
+
+def reverse_complement_codes(codes):
+    return np.where(codes == SEPARATOR, SEPARATOR, 3 - codes)[..., ::-1]
+
+
+def build_kmer_index(fasta_path, index_dir=None, k=KMER_SIZE):
+    """Однократная индексация транскриптома: коды всех транскриптов подряд (через разделитель)
+    и позиции, отсортированные по k-меру (сортировка подсчетом по 4^k корзинам)"""
+    from Bio import SeqIO
+    index_dir = index_dir or f"{fasta_path}.kmer{k}"
+    os.makedirs(index_dir, exist_ok=True)
+    parts, starts, ids, titles = [], [], [], []
+    length = 0
+    for record in SeqIO.parse(fasta_path, "fasta"):
+        codes = encode(str(record.seq))
+        starts.append(length)
+        ids.append(record.id)
+        titles.append(record.description)
+        parts.append(codes)
+        parts.append(np.array([SEPARATOR], dtype=np.uint8))
+        length += len(codes) + 1
+    codes = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+
+    kmers, valid = pack_kmers(codes, k)
+    positions = np.flatnonzero(valid).astype(np.int64)
+    kmers = kmers[valid]
+    order = np.argsort(kmers, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(kmers, minlength=4 ** k))]).astype(np.int64)
+
+    np.save(os.path.join(index_dir, "codes.npy"), codes)
+    np.save(os.path.join(index_dir, "positions.npy"), positions[order])
+    np.save(os.path.join(index_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(index_dir, "starts.npy"), np.asarray(starts + [length], dtype=np.int64))
+    manifest = {'source': os.path.abspath(fasta_path), 'fingerprint': source_fingerprint(fasta_path),
+                'k': k, 'ids': ids, 'titles': titles}
+    with open(os.path.join(index_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    print(f"Индекс k-меров {index_dir}: {len(ids)} транскриптов, {len(positions)} позиций")
+    return index_dir
+
+
+class KmerIndex:
+    """Поиск off-target совпадений siRNA по транскриптому без blastn:
+    все вхождения запроса (и его обратного комплемента) с не более чем max_mismatches заменами.
+    Только совпадения по всей длине без гэпов - подмножество того, что находит blastn-short"""
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.k = manifest['k']
+        self.ids = np.asarray(manifest['ids'], dtype=object)
+        self.titles = manifest['titles']
+        load = lambda name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+        self.codes = load("codes")
+        self.positions = load("positions")
+        self.offsets = load("offsets")
+        self.starts = np.asarray(load("starts"))
+
+    @classmethod
+    def open(cls, fasta_path, k=KMER_SIZE, index_dir=None):
+        """Открывает индекс рядом с FASTA; строит его, если индекса нет или FASTA изменился"""
+        index_dir = index_dir or f"{fasta_path}.kmer{k}"
+        manifest_path = os.path.join(index_dir, MANIFEST)
+        fresh = False
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                fresh = is_fresh(json.load(f), fasta_path)
+        if not fresh:
+            build_kmer_index(fasta_path, index_dir, k)
+        return cls(index_dir)
+
+    def _seed_layout(self, length, max_mismatches):
+        """Непересекающиеся сегменты по k: при max_mismatches заменах хотя бы один сегмент
+        содержит не более max_mismatches // n_segments замен - столько и перебирается в его k-мере"""
+        n_segments = length // self.k
+        if n_segments == 0:
+            raise ValueError(f"Запрос длины {length} короче k-мера индекса ({self.k})")
+        return np.arange(n_segments) * self.k, max_mismatches // n_segments
+
+    def _search_group(self, queries, max_mismatches):
+        """Совпадения запросов одной длины: (номер запроса, позиция в codes, число замен).
+        Запросы с основаниями вне ACGU не ищутся: код 4 испортил бы упакованные сегменты"""
+        length = queries.shape[1]
+        seed_offsets, radius = self._seed_layout(length, max_mismatches)
+        valid = np.flatnonzero(searchable_codes(queries))
+        queries = queries[valid]
+        masks = mismatch_masks(self.k, radius)
+        seeds = np.zeros((len(queries), len(seed_offsets)), dtype=np.uint32)
+        for i in range(self.k):
+            seeds = (seeds << 2) | queries[:, seed_offsets + i].astype(np.uint32)
+
+        # Все k-меры в пределах radius замен от каждого сегмента -> диапазоны корзин индекса
+        neighbours = seeds[:, :, None] ^ masks[None, None, :]
+        lo = self.offsets[neighbours.ravel()]
+        counts = self.offsets[neighbours.ravel() + 1] - lo
+        query = np.repeat(np.repeat(np.arange(len(queries)), len(seed_offsets) * len(masks)), counts)
+        segment = np.repeat(np.tile(np.repeat(seed_offsets, len(masks)), len(queries)), counts)
+        rows = np.repeat(lo, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        candidate = np.asarray(self.positions[rows]) - segment
+
+        # Одно и то же вхождение находится через разные сегменты - оставляем уникальные
+        keep = (candidate >= 0) & (candidate + length <= len(self.codes))
+        pairs = np.unique(np.stack([query[keep], candidate[keep]], axis=1), axis=0)
+        if not len(pairs):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        query, candidate = pairs[:, 0], pairs[:, 1]
+        window = np.asarray(self.codes[candidate[:, None] + np.arange(length)])
+        mismatches = (window != queries[query]).sum(axis=1)
+        # Разделитель транскриптов внутри окна - не совпадение
+        hit = (mismatches <= max_mismatches) & (window != SEPARATOR).all(axis=1)
+        return valid[query[hit]], candidate[hit], mismatches[hit]
+
+    def search(self, sequences, max_mismatches=MAX_MISMATCHES, titles=None, query_offset=0):
+        """Совпадения на обеих цепях в формате blast_parser.parse_hits (query, pident, length, ..., stitle):
+        выравнивание без гэпов по всей длине запроса, minus-цепь - sstart > send, как в BLAST"""
+        from blast_parser import TitleTable
+        titles = titles if titles is not None else TitleTable()
+        sequences = list(sequences)
+        lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+        frames = []
+        for length in np.unique(lengths):
+            members = np.flatnonzero(lengths == length)
+            for i in range(0, len(members), QUERY_CHUNK):
+                chunk = members[i:i + QUERY_CHUNK]
+                forward = np.stack([encode(sequences[q]) for q in chunk])
+                for strand, queries in (('plus', forward), ('minus', reverse_complement_codes(forward))):
+                    query, position, mismatches = self._search_group(np.ascontiguousarray(queries), max_mismatches)
+                    frames.append(self._hits_frame(chunk[query], position, mismatches, int(length), strand,
+                                                   titles, query_offset))
+        if not frames:
+            return pd.DataFrame(columns=['query', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart',
+                                         'qend', 'sstart', 'send', 'evalue', 'bitscore', 'stitle'])
+        hits = pd.concat(frames, ignore_index=True)
+        return hits.sort_values(['query', 'mismatch'], kind='stable').reset_index(drop=True)
+
+    def _hits_frame(self, query, position, mismatches, length, strand, titles, query_offset):
+        transcript = np.searchsorted(self.starts, position, side='right') - 1
+        sstart = position - self.starts[transcript] + 1
+        send = sstart + length - 1
+        if strand == 'minus':
+            sstart, send = send, sstart
+        transcript_titles = np.asarray(self.titles, dtype=object)[transcript]
+        return pd.DataFrame({
+            'query': query + query_offset,
+            'sseqid': self.ids[transcript],
+            'pident': (length - mismatches) / length * 100,
+            'length': np.full(len(query), length, dtype=np.int32),
+            'mismatch': mismatches.astype(np.int32),
+            'gapopen': np.zeros(len(query), dtype=np.int32),
+            'qstart': np.ones(len(query), dtype=np.int32),
+            'qend': np.full(len(query), length, dtype=np.int32),
+            'sstart': sstart,
+            'send': send,
+            'evalue': np.nan,
+            'bitscore': np.nan,
+            'stitle': titles.codes(transcript_titles) if len(query) else np.zeros(0, dtype=np.int32),
+        })
@@ -0,0 +1,112 @@
+import gzip
+
+import pandas as pd
+
+from fragments import FragmentTable
+from rule_engine import RuleEngine
+
+
+def stream_candidates(session, chunk_size=100_000):
+    """Порции кандидатов (sense, antisense) фиксированного размера без полной нарезки региона"""
+    strands = session.editor.strands()
+    for sense in FragmentTable.iter_tiles(strands.sense, session.start_size, session.end_size, chunk_size):
+        yield sense, strands.guide_table(sense)
+
+
+def rules_stage(frame, sense, antisense):
+    """Баллы правил analyz_rna и схем дизайна для порции"""
+    engine = RuleEngine(sense, antisense)
+    for name, values in engine.points().items():
+        frame[name] = values
+    totals = engine.score_schemes()
+    frame['total_points'] = totals.pop('current_total').to_numpy().astype(int)
+    for name in totals.columns:
+        frame[name] = totals[name].to_numpy()
+    return frame
+
+
+def snp_stage(snps_in_exon, exon_start, session=None):
+    """Стадия SNP-аннотации для SNP экзона (см. snp.select_exon_snps).
+    Диапазон длин - из session (start_size..end_size), иначе по длинам пришедших порций"""
+    from snp import SnpCoverage, SnpIndex, snp_scores
+    snp_index = SnpIndex.from_exon(snps_in_exon, exon_start)
+    sizes = None if session is None else (session.start_size, session.end_size)
+    coverage = []
+
+    def stage(frame, sense, antisense):
+        # Покрытие всех длин строится один раз на регион; без session - перестраивается,
+        # если порция принесла длины вне уже покрытого диапазона
+        if not len(sense):
+            return frame
+        lo, hi = int(sense.lengths.min()), int(sense.lengths.max())
+        if coverage and not (coverage[0].start_size <= lo and hi <= coverage[0].end_size):
+            if sizes is not None:
+                raise ValueError(f"Длины порции {lo}..{hi} вне диапазона сессии {sizes[0]}..{sizes[1]}")
+            lo, hi = min(lo, coverage[0].start_size), max(hi, coverage[0].end_size)
+            coverage.clear()
+        if not coverage:
+            start_size, end_size = sizes or (lo, hi)
+            coverage.append(SnpCoverage(snp_index, len(sense.buffer), start_size, end_size))
+        scores = snp_scores(sense.starts, sense.lengths, snp_index, coverage[0])
+        for name in scores.columns:
+            frame[name] = scores[name].to_numpy()
+        return frame
+    return stage
+
+
+def seed_stage(seed_table):
+    """Стадия seed-частот antisense-гидов по 3'UTR (см. seed_table.SeedTable)"""
+    def stage(frame, sense, antisense):
+        scores = seed_table.score(antisense)
+        for name in scores.columns:
+            frame[name] = scores[name].to_numpy()
+        return frame
+    return stage
+
+
+def fold_stage(frame, sense, antisense):
+    """RNA fold для sense-цепи (нужен ViennaRNA)"""
+    from rna_fold import apply_rna_fold
+    folded = apply_rna_fold(frame[['fragment_id']].assign(sequence=frame['sense']))
+    frame['structure'] = folded['structure'].to_numpy()
+    frame['mfe'] = folded['mfe'].to_numpy()
+    return frame
+
+
+def duplex_stage(frame, sense, antisense):
+    """RNA duplex для пар sense/antisense (нужен ViennaRNA)"""
+    from rna_duplex import sirna_duplex_analysis
+    duplex = sirna_duplex_analysis(frame[['fragment_id']].assign(sequence=frame['sense']),
+                                   frame[['fragment_id']].assign(sequence=frame['antisense']))
+    frame['duplex_structure'] = duplex['duplex_structure'].to_numpy()
+    frame['duplex_energy'] = duplex['duplex_energy'].to_numpy()
+    return frame
+
+
+def run_pipeline(session, output='pipeline_results.csv.gz', stages=(rules_stage,), chunk_size=100_000):
+    """Потоковый конвейер: нарезка -> стадии -> дозапись в сжатый CSV, память не зависит от длины входа"""
+    written = 0
+    with gzip.open(output, 'wt', encoding='utf-8') as out:
+        for sense, antisense in stream_candidates(session, chunk_size):
+            frame = pd.DataFrame({
+                'fragment_id': sense.fragment_ids(),
+                'size_nt': sense.lengths,
+                'sense': sense.sequences(),
+                'antisense': antisense.sequences(),
+            })
+            for stage in stages:
+                frame = stage(frame, sense, antisense)
+            frame.to_csv(out, header=written == 0, index=False)
+            written += len(frame)
+    print(f"Записано кандидатов: {written} -> {output}")
+    return written
+
+
+if __name__ == "__main__":
+    import os
+    from prepare_rna import get_session
+    from seed_table import UTR_FASTA, SeedTable
+    stages = [rules_stage]
+    if os.path.exists(UTR_FASTA):
+        stages.append(seed_stage(SeedTable.open(UTR_FASTA)))
+    run_pipeline(get_session(), stages=stages)
@@ -2,24 +2,19 @@ import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from matplotlib.patches import FancyBboxPatch
 import pandas as pd
-from prepare_rna import df_sense, df_antisense
-from rna_duplex import duplex_df
+from prepare_rna import get_session
+from rna_duplex import get_duplex_df, get_duplex_index
 
 
 def get_sequences_by_id(sense_id, antisense_id):
     """Получить последовательности по ID"""
-    sense_seq = df_sense[df_sense['fragment_id'] == sense_id]['sequence'].iloc[0]
-    antisense_seq = df_antisense[df_antisense['fragment_id'] == antisense_id]['sequence'].iloc[0]
-    return sense_seq, antisense_seq
+    catalog = get_session().catalog
+    return catalog.sense(sense_id), catalog.antisense(antisense_id)
 
 
 def get_duplex_data(sense_id, antisense_id):
     """Получить данные дуплекса по ID"""
-    duplex_data = duplex_df[
-        (duplex_df['sense_id'] == sense_id) &
-        (duplex_df['antisense_id'] == antisense_id)
-        ].iloc[0]
-    return duplex_data
+    return get_duplex_df().iloc[get_duplex_index()[(sense_id, antisense_id)]]
 
 
 def get_base_color(base, symbol):
@@ -178,15 +173,16 @@ def plot_duplex_by_id(sense_id, antisense_id, save_path=None, figsize=(18, 8)):
 
 def show_available_sequences():
     """Показать доступные последовательности"""
+    catalog = get_session().catalog
     print("\nДоступные sense последовательности:")
-    sense_ids = df_sense['fragment_id'].unique()
+    sense_ids = catalog.fragment_ids
     for i, sid in enumerate(sense_ids[:20]):  # Показываем первые 20
         print(f"  {sid}")
     if len(sense_ids) > 20:
         print(f"  ... и еще {len(sense_ids) - 20} последовательностей")
 
     print("\nДоступные antisense последовательности:")
-    anti_ids = df_antisense['fragment_id'].unique()
+    anti_ids = catalog.fragment_ids
     for i, aid in enumerate(anti_ids[:20]):  # Показываем первые 20
         print(f"  {aid}")
     if len(anti_ids) > 20:
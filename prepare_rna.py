@@ -1,81 +1,89 @@
 from datetime import datetime
+from functools import cached_property, lru_cache
+
 import pandas as pd
 from Bio import SeqIO
-sequence1 = SeqIO.read("sequence.fasta", "fasta")
-ATXN1 = str(sequence1.seq)
+
+from catalog import FragmentCatalog
+from composition import CompositionIndex
+from fragments import FragmentTable
+from strand import StrandViews
+
+FASTA_PATH = "sequence.fasta"
+# Кодирующий регион ATXN1 в sequence.fasta (срез [start:end])
+REGION = (781, 2858)
 
 
 class editor_rna:
     """Метод класса для работы с размерами RNA"""
-    def __init__(self):
-        self.sequence = ATXN1
+    def __init__(self, sequence=None, region=REGION):
+        if sequence is None:
+            sequence = get_session().sequence
+        self.sequence = sequence
+        # Регион нарезки (start, end); None - вся последовательность
+        self.region = region if region is not None else (0, len(sequence))
+        self._composition = None
+        self._strands = None
+
+    def strands(self):
+        """Sense, complement и reverse-complement кодирующего региона"""
+        if self._strands is None:
+            start, end = self.region
+            self._strands = StrandViews(self.sequence[start:end])
+        return self._strands
+
+    def sense_region(self):
+        """Кодирующий регион в РНК-алфавите, из которого нарезаются фрагменты"""
+        return self.strands().sense.decode('ascii')
+
+    def composition(self):
+        """Индекс состава региона, общий для всех длин фрагментов 15-30"""
+        if self._composition is None:
+            self._composition = CompositionIndex(self.sense_region())
+        return self._composition
 
     def info_rna(self):
         """Метод выводит последовательность РНК"""
         print(self.sequence)
         print(f"Длина последовательности: {len(self.sequence)}")
 
-    def sense(self, start_size=15, end_size=30, filename=None):
-        sense = self.sequence.replace('T', 'U')
-        sense = sense[781:2858]
-        start_size = 15
-        end_size = 30 + 1
-        fragments_list = []
-        print(f"Длина фрагмента для нарезки: {len(sense)} нуклеотидов")
-        for fragment_size in range(start_size, end_size):
-            for start_pos in range(0, len(sense) - fragment_size + 1):
-                end_pos = start_pos + fragment_size
-                if end_pos > len(sense):
-                    break
-                fragment = sense[start_pos:end_pos]
+    def sense_table(self, start_size=15, end_size=30):
+        """Компактная таблица sense-фрагментов (без материализации строк)"""
+        return FragmentTable.tile(self.strands().sense, start_size, end_size)
 
-                fragments_list.append({
-                    'fragment_id': f"{fragment_size}_{start_pos + 1}",
-                    'size_nt': fragment_size,
-                    'sequence': fragment,
-                    'sequence_length': len(fragment)
-                })
-        df_sense = pd.DataFrame(fragments_list)
+    def antisense_table(self, start_size=15, end_size=30, sense_table=None):
+        """Antisense-гиды 5'->3' (reverse-complement sense-окон) с тем же fragment_id, что у партнера"""
+        if sense_table is None:
+            sense_table = self.sense_table(start_size, end_size)
+        return self.strands().guide_table(sense_table)
+
+    def sense(self, start_size=15, end_size=30, filename=None, table=None):
+        if table is None:
+            table = self.sense_table(start_size, end_size)
+        print(f"Длина фрагмента для нарезки: {len(table.buffer)} нуклеотидов")
+        df_sense = table.to_frame()
         if filename:
             df_sense.to_csv(filename, index=False)
             print(f"Результаты сохранены в файл: {filename}")
-        print(f"Создано {len(fragments_list)} фрагментов")
+        print(f"Создано {len(df_sense)} фрагментов")
         return df_sense
 
-    def antisense(self, start_size=15, end_size=30, filename=None):
-        sense = self.sequence.replace('T', 'U')
-        comp_dict = {'A': 'U', 'U': 'A', 'C': 'G', 'G': 'C'}
-        antisense = ''.join(comp_dict.get(nuc, nuc) for nuc in sense.upper())
-        antisense = antisense[781:2858]
-        start_size = 15
-        end_size = 30 + 1
-        fragments_list = []
-        print(f"Длина фрагмента для нарезки: {len(antisense)} нуклеотидов")
-        for fragment_size in range(start_size, end_size):
-            for start_pos in range(0, len(antisense) - fragment_size + 1):
-                end_pos = start_pos + fragment_size
-                if end_pos > len(antisense):
-                    break
-                fragment = antisense[start_pos:end_pos]
-
-                fragments_list.append({
-                    'fragment_id': f"{fragment_size}_{start_pos + 1}",
-                    'size_nt': fragment_size,
-                    'sequence': fragment,
-                    'sequence_length': len(fragment)
-                })
-        df_antisense = pd.DataFrame(fragments_list)
+    def antisense(self, start_size=15, end_size=30, filename=None, table=None):
+        if table is None:
+            table = self.antisense_table(start_size, end_size)
+        print(f"Длина фрагмента для нарезки: {len(table.buffer)} нуклеотидов")
+        df_antisense = table.to_frame()
         if filename:
             df_antisense.to_csv(filename, index=False)
             print(f"Результаты сохранены в файл: {filename}")
-        print(f"Создано {len(fragments_list)} фрагментов")
+        print(f"Создано {len(df_antisense)} фрагментов")
         return df_antisense
 
     def slice_rna(self, start_size=15, end_size=30, filename=None):
         # start = int(input("Введите начальный индекс: "))
         # end = int(input("Введите конечный индекс: "))
         # frag = self.sequence[start:end]
-        frag = self.sequence[781:2858]
+        frag = self.sequence[self.region[0]:self.region[1]]
         # start_size = int(input("Введите начальный размер: "))
         # end_size = int(input("Введите конечный размер: ")) + 1
         start_size = 15
@@ -104,9 +112,84 @@ class editor_rna:
         print(f"Создано {len(fragments_list)} фрагментов")
         return df
 
-a = editor_rna()
-df_sense = a.sense()
-print(df_sense)
-df_antisense = a.antisense()
+
+
+class FragmentSession:
+    """Сессия работы с транскриптом: чтение и нарезка выполняются лениво и только один раз"""
+    def __init__(self, fasta_path=FASTA_PATH, start_size=15, end_size=30, region=REGION):
+        self.fasta_path = fasta_path
+        self.region = region
+        self.start_size = start_size
+        self.end_size = end_size
+
+    @classmethod
+    def from_sequence(cls, sequence, region=None, start_size=15, end_size=30):
+        """Сессия для уже прочитанной последовательности (например, записи multi-FASTA)"""
+        session = cls(fasta_path=None, start_size=start_size, end_size=end_size, region=region)
+        session.__dict__['sequence'] = str(sequence)
+        return session
+
+    @cached_property
+    def sequence(self):
+        """Последовательность транскрипта (FASTA читается при первом обращении)"""
+        return str(SeqIO.read(self.fasta_path, "fasta").seq)
+
+    @cached_property
+    def editor(self):
+        return editor_rna(self.sequence, self.region)
+
+    @cached_property
+    def sense_table(self):
+        """Компактная таблица sense-фрагментов: буфер цепи и массивы (start, length)"""
+        return self.editor.sense_table(self.start_size, self.end_size)
+
+    @cached_property
+    def antisense_table(self):
+        """Компактная таблица antisense-фрагментов: буфер цепи и массивы (start, length)"""
+        return self.editor.antisense_table(sense_table=self.sense_table)
+
+    @cached_property
+    def df_sense(self):
+        """DataFrame sense-фрагментов (строки создаются при первом обращении)"""
+        return self.editor.sense(table=self.sense_table)
+
+    @cached_property
+    def df_antisense(self):
+        """DataFrame antisense-фрагментов (строки создаются при первом обращении)"""
+        return self.editor.antisense(table=self.antisense_table)
+
+    @cached_property
+    def catalog(self):
+        """Индекс пар siRNA по id, последовательности и партнеру (см. catalog.FragmentCatalog)"""
+        return FragmentCatalog.from_tables(self.sense_table, self.antisense_table)
+
+    def reset(self):
+        """Сбрасывает все закэшированные данные сессии"""
+        names = ['editor', 'sense_table', 'antisense_table', 'df_sense', 'df_antisense', 'catalog']
+        if self.fasta_path is not None:
+            names.append('sequence')
+        for name in names:
+            self.__dict__.pop(name, None)
+
+
+@lru_cache(maxsize=None)
+def get_session(fasta_path=FASTA_PATH):
+    """Общая сессия процесса для заданного FASTA-файла"""
+    return FragmentSession(fasta_path)
+
+
+def __getattr__(name):
+    """Обратная совместимость: df_sense, df_antisense и ATXN1 берутся из сессии по умолчанию"""
+    if name in ('df_sense', 'df_antisense'):
+        return getattr(get_session(), name)
+    if name == 'ATXN1':
+        return get_session().sequence
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    session = get_session()
+    print(session.df_sense)
+    print(session.df_antisense)
 
 
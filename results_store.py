@@ -0,0 +1,144 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+DEFAULT_STORE = "results_store"
+
+
+def _column_values(series):
+    """Значения столбца и его numpy-тип; nullable Int/boolean -> float с NaN вместо pd.NA"""
+    dtype = getattr(series.dtype, 'numpy_dtype', None)
+    if dtype is not None and dtype.kind in 'biu':
+        return series.to_numpy(dtype=np.float64, na_value=np.nan), dtype
+    values = series.to_numpy()
+    return values, values.dtype
+
+
+def _nullable_dtype(dtype):
+    """Nullable-тип pandas для bool/int столбца с пропусками (boolean, Int64, UInt8, ...)"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'b':
+        return 'boolean'
+    return f"{'UInt' if dtype.kind == 'u' else 'Int'}{dtype.itemsize * 8}"
+
+
+class ResultsStore:
+    """Колоночное хранилище результатов: .npy-столбец на каждое поле и manifest.json, ключ - fragment_id"""
+    def __init__(self, path=DEFAULT_STORE, key='fragment_id'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'key': key, 'rows': 0, 'columns': {}}
+        self._key_index = None
+
+    @property
+    def key(self):
+        return self.manifest['key']
+
+    @property
+    def columns(self):
+        return list(self.manifest['columns'])
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def _save_manifest(self):
+        tmp_path = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+    def _save_column(self, name, values, source, dtype=None):
+        values = np.asarray(values)
+        kind = 'str' if values.dtype.kind in 'OUS' else values.dtype.str
+        if kind == 'str':
+            # Строки хранятся как байты фиксированной ширины - такой столбец можно отобразить в память
+            values = np.array([str(v).encode('utf-8') if not pd.isna(v) else b'' for v in values],
+                              dtype=np.bytes_)
+        file_name = f"{name}.npy"
+        np.save(os.path.join(self.path, file_name), values)
+        self.manifest['columns'][name] = {'file': file_name, 'kind': kind, 'source': source}
+        if dtype is not None:
+            # Исходный bool/int тип столбца, сохраненного как float с NaN
+            self.manifest['columns'][name]['dtype'] = dtype
+
+    def key_index(self):
+        """pandas.Index по ключевому столбцу (для выравнивания новых столбцов)"""
+        if self._key_index is None:
+            self._key_index = pd.Index(self.read(self.key).astype(str))
+        return self._key_index
+
+    def write_frame(self, frame, columns=None, source=None, key=None):
+        """Добавляет (или перезаписывает) столбцы frame, выравнивая строки по ключу хранилища"""
+        key = key or self.key
+        keys = frame[key].astype(str).to_numpy()
+        columns = [c for c in (columns or frame.columns) if c != key]
+        duplicated = pd.Index(keys).duplicated()
+        if duplicated.any():
+            raise ValueError(f"Повторяющиеся ключи {key} ({int(duplicated.sum())}), например {keys[duplicated][0]}")
+
+        if self.manifest['rows'] == 0:
+            self._save_column(self.key, keys, source)
+            self.manifest['rows'] = len(keys)
+            self._key_index = pd.Index(keys)
+            positions = np.arange(len(keys))
+        else:
+            positions = self.key_index().get_indexer(keys)
+            if (positions < 0).any():
+                raise ValueError(f"{int((positions < 0).sum())} ключей отсутствуют в хранилище {self.path}")
+
+        rows = self.manifest['rows']
+        full = len(positions) == rows and np.array_equal(positions, np.arange(rows))
+        for name in columns:
+            values, dtype = _column_values(frame[name])
+            if full:
+                aligned = values
+            elif values.dtype.kind in 'biuf':
+                aligned = np.full(rows, np.nan)
+                aligned[positions] = values
+            else:
+                aligned = np.full(rows, '', dtype=object)
+                aligned[positions] = values
+            # bool/int с пропусками хранятся как float с NaN, тип восстанавливается в to_frame
+            restore = dtype.str if dtype.kind in 'biu' and aligned.dtype.kind == 'f' else None
+            self._save_column(name, aligned, source, restore)
+        self._save_manifest()
+        return self
+
+    def read(self, name, mmap=True):
+        """Столбец, отображенный в память (без копирования и разбора текста);
+        bool/int столбцы с пропусками - как сохранены, float с NaN"""
+        info = self.manifest['columns'][name]
+        return np.load(os.path.join(self.path, info['file']), mmap_mode='r' if mmap else None)
+
+    def to_frame(self, columns=None):
+        """DataFrame из выбранных столбцов (байтовые строки декодируются,
+        bool/int столбцы с пропусками - nullable-типы pandas)"""
+        columns = columns or self.columns
+        if self.key not in columns:
+            columns = [self.key] + list(columns)
+        data = {}
+        for name in columns:
+            values = self.read(name)
+            info = self.manifest['columns'][name]
+            if info['kind'] == 'str':
+                values = np.char.decode(values, 'utf-8')
+            elif 'dtype' in info:
+                values = pd.array(values, dtype=_nullable_dtype(info['dtype']))
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+def save_results(frame, source, columns=None, key='fragment_id', path=DEFAULT_STORE):
+    """Добавляет результаты стадии в общее хранилище рядом с CSV"""
+    store = ResultsStore(path)
+    store.write_frame(frame, columns=columns, source=source, key=key)
+    print(f"Столбцы {source} добавлены в хранилище: {path}")
+    return store
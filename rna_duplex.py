@@ -1,28 +1,33 @@
+from functools import lru_cache
+
 import RNA
 import pandas as pd
 
-from prepare_rna import df_sense, df_antisense
+from catalog import FragmentCatalog
+from prepare_rna import get_session
+from results_store import save_results
 
 def sirna_duplex_analysis(df_sense, df_antisense, name=""):
     """Анализ дуплексов для siRNA из DataFrame"""
 
     results = []
 
-    # Предполагаем, что DataFrame имеют колонку 'sequence'
-    for idx, (sense_row, antisense_row) in enumerate(zip(df_sense.iterrows(), df_antisense.iterrows())):
-        sense_idx, sense_data = sense_row
-        antisense_idx, antisense_data = antisense_row
-
-        sense_seq = sense_data['sequence']  # Получаем последовательность
-        antisense_seq = antisense_data['sequence']  # Получаем последовательность
+    # Пары сопоставляются по fragment_id через каталог; без id - по порядку строк, как раньше
+    if 'fragment_id' in df_sense and 'fragment_id' in df_antisense:
+        catalog = FragmentCatalog.from_frames(df_sense, df_antisense)
+        pairs = zip(catalog.fragment_ids, catalog.fragment_ids, catalog.sense_sequences, catalog.antisense_sequences)
+    else:
+        pairs = ((f'sense_{idx}', f'antisense_{idx}', sense_seq, antisense_seq)
+                 for idx, (sense_seq, antisense_seq) in enumerate(zip(df_sense['sequence'], df_antisense['sequence'])))
 
+    for idx, (sense_id, antisense_id, sense_seq, antisense_seq) in enumerate(pairs):
         try:
             # RNA duplex для двух цепей siRNA
             duplex_result = RNA.duplexfold(sense_seq, antisense_seq)
 
             results.append({
-                'sense_id': sense_data.get('fragment_id', f'sense_{idx}'),
-                'antisense_id': antisense_data.get('fragment_id', f'antisense_{idx}'),
+                'sense_id': sense_id,
+                'antisense_id': antisense_id,
                 'sense_sequence': sense_seq,
                 'antisense_sequence': antisense_seq,
                 'duplex_structure': duplex_result.structure,
@@ -36,8 +41,8 @@ def sirna_duplex_analysis(df_sense, df_antisense, name=""):
         except Exception as e:
             print(f"Ошибка для пары {idx}: {e}")
             results.append({
-                'sense_id': sense_data.get('fragment_id', f'sense_{idx}'),
-                'antisense_id': antisense_data.get('fragment_id', f'antisense_{idx}'),
+                'sense_id': sense_id,
+                'antisense_id': antisense_id,
                 'sense_sequence': sense_seq,
                 'antisense_sequence': antisense_seq,
                 'duplex_structure': 'ERROR',
@@ -48,15 +53,32 @@ def sirna_duplex_analysis(df_sense, df_antisense, name=""):
 
     return pd.DataFrame(results)
 
-# Запускаем анализ
-print("Запускаем RNA duplex...")
-duplex_df = sirna_duplex_analysis(df_sense, df_antisense)
 
-# Показываем результаты
-print("\nРезультаты RNA duplex:")
-print(duplex_df[['sense_id', 'antisense_id', 'duplex_energy', 'duplex_structure']].head())
+@lru_cache(maxsize=None)
+def get_duplex_df():
+    """Дуплексы для сессии по умолчанию (считаются при первом обращении)"""
+    session = get_session()
+    return sirna_duplex_analysis(session.df_sense, session.df_antisense)
+
+
+@lru_cache(maxsize=None)
+def get_duplex_index():
+    """{(sense_id, antisense_id): номер строки get_duplex_df()}"""
+    duplex_df = get_duplex_df()
+    return {pair: row for row, pair in enumerate(zip(duplex_df['sense_id'], duplex_df['antisense_id']))}
+
+
+if __name__ == "__main__":
+    # Запускаем анализ
+    print("Запускаем RNA duplex...")
+    duplex_df = get_duplex_df()
+
+    # Показываем результаты
+    print("\nРезультаты RNA duplex:")
+    print(duplex_df[['sense_id', 'antisense_id', 'duplex_energy', 'duplex_structure']].head())
 
-# Сохраняем в файл
-duplex_df.to_csv('rna_duplex_results.csv', index=False)
-print(f"\nСохранено результатов: {len(duplex_df)}")
-print("Файл: rna_duplex.py_results.csv")
\ No newline at end of file
+    # Сохраняем в файл
+    duplex_df.to_csv('rna_duplex_results.csv', index=False)
+    save_results(duplex_df, 'rna_duplex', columns=['duplex_structure', 'duplex_energy'], key='sense_id')
+    print(f"\nСохранено результатов: {len(duplex_df)}")
+    print("Файл: rna_duplex.py_results.csv")
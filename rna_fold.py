@@ -1,6 +1,7 @@
 import pandas as pd
 import RNA
-from prepare_rna import df_sense, df_antisense
+from prepare_rna import get_session
+from results_store import save_results
 
 # Применяем RNA fold ко всем последовательностям
 def apply_rna_fold(df_sense):
@@ -37,25 +38,27 @@ def apply_rna_fold(df_sense):
     return pd.DataFrame(results)
 
 
-# Запускаем RNA fold
-print("Запускаем RNA fold...")
-folded_df_sense = apply_rna_fold(df_sense)
-
-# Показываем результаты
-print("\nРезультаты RNA fold:")
-print(folded_df_sense[['fragment_id', 'sequence', 'structure', 'mfe']].head(10))
-# Проверяем различные типы структур
-print("Примеры структур:")
-for i, row in folded_df_sense.head(5).iterrows():
-    print(f"{row['fragment_id']}: {row['structure']} (энергия: {row['mfe']:.2f})")
-
-# Статистика по энергиям
-print(f"\nСтатистика по свободной энергии:")
-print(f"Минимальная: {folded_df_sense['mfe'].min():.2f}")
-print(f"Максимальная: {folded_df_sense['mfe'].max():.2f}")
-print(f"Средняя: {folded_df_sense['mfe'].mean():.2f}")
-
-# Сохраняем в файл
-folded_df_sense.to_csv('rna_fold_results.csv', index=False)
-print(f"\nСохранено результатов: {len(folded_df_sense)}")
-print("Файл: rna_fold_results.csv")
\ No newline at end of file
+if __name__ == "__main__":
+    # Запускаем RNA fold
+    print("Запускаем RNA fold...")
+    folded_df_sense = apply_rna_fold(get_session().df_sense)
+
+    # Показываем результаты
+    print("\nРезультаты RNA fold:")
+    print(folded_df_sense[['fragment_id', 'sequence', 'structure', 'mfe']].head(10))
+    # Проверяем различные типы структур
+    print("Примеры структур:")
+    for i, row in folded_df_sense.head(5).iterrows():
+        print(f"{row['fragment_id']}: {row['structure']} (энергия: {row['mfe']:.2f})")
+
+    # Статистика по энергиям
+    print(f"\nСтатистика по свободной энергии:")
+    print(f"Минимальная: {folded_df_sense['mfe'].min():.2f}")
+    print(f"Максимальная: {folded_df_sense['mfe'].max():.2f}")
+    print(f"Средняя: {folded_df_sense['mfe'].mean():.2f}")
+
+    # Сохраняем в файл
+    folded_df_sense.to_csv('rna_fold_results.csv', index=False)
+    save_results(folded_df_sense, 'rna_fold', columns=['structure', 'mfe'])
+    print(f"\nСохранено результатов: {len(folded_df_sense)}")
+    print("Файл: rna_fold_results.csv")
@@ -0,0 +1,275 @@
+import numpy as np
+import pandas as pd
+
+from fragments import FragmentTable
+
+# Коды нуклеотидов в матрице uint8 (ASCII)
+A, C, G, U = (ord(base) for base in 'ACGU')
+
+
+def encode_fragments(sequences):
+    """Кодирует фрагменты в матрицы uint8: {длина: (номера строк, матрица n x длина)}"""
+    sequences = [str(seq).upper() for seq in sequences]
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    groups = {}
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        buffer = ''.join(sequences[i] for i in rows).encode('ascii')
+        matrix = np.frombuffer(buffer, dtype=np.uint8).reshape(len(rows), int(length))
+        groups[int(length)] = (rows, matrix)
+    return groups, lengths
+
+
+# Признаки, по которым считаются схемы оценки (порядок столбцов матрицы признаков)
+FEATURE_NAMES = (
+    'gc_36_52', 'gc_30_52', 'low_repeats', 'dt_overhang',
+    'u_at_1', 'a_at_3', 'a_at_6', 'u_at_10', 'g_at_13', 'no_g_at_13',
+    'a_at_19', 'a_u_at_19', 'g_c_at_19', 'no_g_c_at_19', 'a_at_3_19',
+    'g_c_5_end', 'au_1_5', 'au_15_19', 'end_asymmetry', 'no_long_gc_run',
+    'antisense_a_at_6', 'antisense_a_u_5_end', 'antisense_au_rich_1_7',
+)
+
+# Схемы оценки: вес каждого признака. Позиции считаются от 5'-конца sense-цепи
+SCHEMES = {
+    # Текущие десять правил analyz_rna.final_count
+    'current': {
+        'gc_36_52': 1, 'low_repeats': 1, 'dt_overhang': 1, 'u_at_10': 1, 'no_g_at_13': 1,
+        'no_g_c_at_19': 1, 'a_at_3_19': 1, 'g_c_5_end': 1, 'antisense_a_at_6': 1,
+        'antisense_a_u_5_end': 1,
+    },
+    # Reynolds et al., 2004 (без критерия внутренних повторов по Tm)
+    'reynolds': {
+        'gc_30_52': 1, 'au_15_19': 1, 'a_at_19': 1, 'a_at_3': 1, 'u_at_10': 1,
+        'g_c_at_19': -1, 'g_at_13': -1,
+    },
+    # Ui-Tei et al., 2004
+    'ui_tei': {
+        'antisense_a_u_5_end': 1, 'g_c_5_end': 1, 'antisense_au_rich_1_7': 1, 'no_long_gc_run': 1,
+    },
+    # Amarzguioui & Prydz, 2004
+    'amarzguioui': {
+        'a_u_at_19': 1, 'g_c_5_end': 1, 'a_at_6': 1, 'end_asymmetry': 1,
+        'u_at_1': -1, 'g_c_at_19': -1,
+    },
+}
+
+
+def scheme_weights(scheme):
+    """Вектор весов схемы: словарь {признак: вес} или последовательность длины FEATURE_NAMES"""
+    if isinstance(scheme, dict):
+        unknown = set(scheme) - set(FEATURE_NAMES)
+        if unknown:
+            raise ValueError(f"Неизвестные признаки: {sorted(unknown)}")
+        return np.array([scheme.get(name, 0) for name in FEATURE_NAMES], dtype=np.float64)
+    weights = np.asarray(scheme, dtype=np.float64)
+    if weights.shape != (len(FEATURE_NAMES),):
+        raise ValueError(f"Ожидается {len(FEATURE_NAMES)} весов, получено {weights.shape}")
+    return weights
+
+
+def _longest_run(mask):
+    """Длина самой длинной серии True в каждой строке"""
+    current = np.zeros(mask.shape[0], dtype=np.int64)
+    longest = np.zeros(mask.shape[0], dtype=np.int64)
+    for j in range(mask.shape[1]):
+        current = np.where(mask[:, j], current + 1, 0)
+        np.maximum(longest, current, out=longest)
+    return longest
+
+
+def _column(matrix, position):
+    """Столбец матрицы по позиции (1-based) или нули, если фрагмент короче"""
+    if matrix.shape[1] < position:
+        return np.zeros(matrix.shape[0], dtype=np.uint8)
+    return matrix[:, position - 1]
+
+
+def _encode(fragments):
+    """Группы по длинам для FragmentTable (без копирования строк) или списка последовательностей"""
+    if isinstance(fragments, FragmentTable):
+        return fragments.length_groups(), fragments.lengths.astype(np.int64)
+    return encode_fragments(fragments)
+
+
+class RuleEngine:
+    """Векторизованный расчет правил analyz_rna за один проход по закодированным фрагментам"""
+    def __init__(self, sense, antisense):
+        if not isinstance(sense, FragmentTable):
+            sense = list(sense)
+        if not isinstance(antisense, FragmentTable):
+            antisense = list(antisense)
+        self.sense = sense
+        self.antisense = antisense
+        self.sense_groups, self.lengths = _encode(sense)
+        self.antisense_groups, _ = _encode(antisense)
+        self.n = len(self.lengths)
+        self._features = None
+        self._feature_matrix = None
+
+    @classmethod
+    def from_session(cls, session):
+        return cls(session.sense_table, session.antisense_table)
+
+    @staticmethod
+    def _strings(fragments):
+        if isinstance(fragments, FragmentTable):
+            return fragments.sequences()
+        return fragments
+
+    def features(self):
+        """Позиционные и композиционные признаки всех фрагментов (считаются один раз)"""
+        if self._features is not None:
+            return self._features
+        n = self.n
+        f = {name: np.zeros(n, dtype=np.int64) for name in (
+            'g_count', 'c_count', 'gc_frequency', 'au_frequency', 'au_1_5', 'au_15_19',
+            'max_gc_run', 'antisense_au_1_7')}
+        for name in ('u_at_10', 'no_g_at_13', 'no_g_c_at_19', 'a_at_3_19', 'g_c_5_end',
+                     'a_at_6', 'a_u_5_end', 'u_at_1', 'a_at_3', 'sense_a_at_6', 'g_at_13',
+                     'a_at_19', 'a_u_at_19', 'g_c_at_19'):
+            f[name] = np.zeros(n, dtype=bool)
+
+        for length, (rows, m) in self.sense_groups.items():
+            f['g_count'][rows] = (m == G).sum(axis=1)
+            f['c_count'][rows] = (m == C).sum(axis=1)
+            f['gc_frequency'][rows] = ((m[:, :-1] == G) & (m[:, 1:] == C)).sum(axis=1)
+            f['au_frequency'][rows] = ((m[:, :-1] == A) & (m[:, 1:] == U)).sum(axis=1)
+            f['u_at_10'][rows] = _column(m, 10) == U
+            f['no_g_at_13'][rows] = (length >= 13) & (_column(m, 13) != G)
+            p19 = _column(m, 19)
+            f['no_g_c_at_19'][rows] = (length >= 19) & (p19 != G) & (p19 != C)
+            f['a_at_3_19'][rows] = (length >= 19) & (_column(m, 3) == A) & (p19 == A)
+            f['g_c_5_end'][rows] = (m[:, 0] == G) | (m[:, 0] == C)
+            f['u_at_1'][rows] = m[:, 0] == U
+            f['a_at_3'][rows] = _column(m, 3) == A
+            f['sense_a_at_6'][rows] = _column(m, 6) == A
+            f['g_at_13'][rows] = _column(m, 13) == G
+            f['a_at_19'][rows] = p19 == A
+            f['a_u_at_19'][rows] = (p19 == A) | (p19 == U)
+            f['g_c_at_19'][rows] = (p19 == G) | (p19 == C)
+            au = (m == A) | (m == U)
+            f['au_1_5'][rows] = au[:, :5].sum(axis=1)
+            f['au_15_19'][rows] = au[:, 14:19].sum(axis=1)
+            f['max_gc_run'][rows] = _longest_run((m == G) | (m == C))
+
+        for length, (rows, m) in self.antisense_groups.items():
+            f['a_at_6'][rows] = _column(m, 6) == A
+            f['a_u_5_end'][rows] = (m[:, 0] == A) | (m[:, 0] == U)
+            f['antisense_au_1_7'][rows] = ((m[:, :7] == A) | (m[:, :7] == U)).sum(axis=1)
+
+        lengths = self.lengths
+        safe_lengths = np.maximum(lengths, 1)
+        f['length'] = lengths
+        f['gc_percent'] = np.where(lengths > 0, (f['g_count'] + f['c_count']) / safe_lengths * 100, 0.0)
+        f['gc_in_range'] = (f['gc_percent'] >= 36) & (f['gc_percent'] <= 52)
+        f['low_repeats'] = (f['gc_frequency'] <= 3) & (f['au_frequency'] <= 4)
+        self._features = f
+        return f
+
+    def feature_matrix(self):
+        """Матрица признаков n x len(FEATURE_NAMES), общая для всех схем оценки"""
+        if self._feature_matrix is not None:
+            return self._feature_matrix
+        f = self.features()
+        columns = {
+            'gc_36_52': f['gc_in_range'],
+            'gc_30_52': (f['gc_percent'] >= 30) & (f['gc_percent'] <= 52),
+            'low_repeats': f['low_repeats'],
+            'dt_overhang': np.ones(self.n, dtype=bool),
+            'u_at_1': f['u_at_1'],
+            'a_at_3': f['a_at_3'],
+            'a_at_6': f['sense_a_at_6'],
+            'u_at_10': f['u_at_10'],
+            'g_at_13': f['g_at_13'],
+            'no_g_at_13': f['no_g_at_13'],
+            'a_at_19': f['a_at_19'],
+            'a_u_at_19': f['a_u_at_19'],
+            'g_c_at_19': f['g_c_at_19'],
+            'no_g_c_at_19': f['no_g_c_at_19'],
+            'a_at_3_19': f['a_at_3_19'],
+            'g_c_5_end': f['g_c_5_end'],
+            'au_1_5': f['au_1_5'],
+            'au_15_19': f['au_15_19'],
+            'end_asymmetry': f['au_15_19'] > f['au_1_5'],
+            'no_long_gc_run': f['max_gc_run'] <= 9,
+            'antisense_a_at_6': f['a_at_6'],
+            'antisense_a_u_5_end': f['a_u_5_end'],
+            'antisense_au_rich_1_7': f['antisense_au_1_7'] >= 5,
+        }
+        self._feature_matrix = np.column_stack(
+            [columns[name].astype(np.float64) for name in FEATURE_NAMES])
+        return self._feature_matrix
+
+    def score_schemes(self, schemes=None):
+        """Итоговые баллы нескольких схем за одно умножение матрицы признаков на матрицу весов"""
+        if schemes is None:
+            schemes = SCHEMES
+        names = list(schemes)
+        weights = np.column_stack([scheme_weights(schemes[name]) for name in names])
+        totals = self.feature_matrix() @ weights
+        return pd.DataFrame({f"{name}_total": totals[:, i] for i, name in enumerate(names)})
+
+    def points(self):
+        """Баллы десяти правил в порядке final_count"""
+        f = self.features()
+        as_int = lambda values: values.astype(np.int64)
+        return {
+            'm1_gc_point': as_int(f['gc_in_range']),
+            'm2_frequency_point': as_int(f['low_repeats']),
+            'm3_dt_point': np.ones(self.n, dtype=np.int64),
+            'm4_u_10_point': as_int(f['u_at_10']),
+            'm5_no_g_13_point': as_int(f['no_g_at_13']),
+            'm6_no_g_c_19_point': as_int(f['no_g_c_at_19']),
+            'm7_a_at_3_19_point': as_int(f['a_at_3_19']),
+            'm8_g_c_5_end_point': as_int(f['g_c_5_end']),
+            'm9_a_at_6_point': as_int(f['a_at_6']),
+            'm10_a_u_5_end_point': as_int(f['a_u_5_end']),
+        }
+
+    def total_points(self):
+        return sum(self.points().values())
+
+    def combined(self, dt_count=2):
+        """Те же столбцы, что и analyz_rna.get_combined_data, без циклов по фрагментам"""
+        f = self.features()
+        p = self.points()
+        n = self.n
+        sense = pd.Series(self._strings(self.sense), dtype=object)
+        antisense = pd.Series(self._strings(self.antisense), dtype=object)
+        dt_overhang = 'T' * dt_count
+        return pd.DataFrame({
+            'm1_sequence_id': [f"seq_{idx + 1:03d}" for idx in range(n)],
+            'm1_sense': sense,
+            'm1_length': f['length'],
+            'm1_gc_percent': np.round(f['gc_percent'], 2),
+            'm1_gc_point': p['m1_gc_point'],
+            'm2_sense': sense,
+            'm2_gc_frequency': f['gc_frequency'],
+            'm2_au_frequency': f['au_frequency'],
+            'm2_frequency_point': p['m2_frequency_point'],
+            'm3_sense_with_dt': dt_overhang + sense.str.upper() + dt_overhang,
+            'm3_original_length': f['length'],
+            'm3_extended_length': f['length'] + 2 * dt_count,
+            'm3_dt_point': p['m3_dt_point'],
+            'm4_sense': sense,
+            'm4_has_u_at_10': p['m4_u_10_point'],
+            'm4_u_10_point': p['m4_u_10_point'],
+            'm5_sense': sense,
+            'm5_hasnt_g_at_13': p['m5_no_g_13_point'],
+            'm5_no_g_13_point': p['m5_no_g_13_point'],
+            'm6_sense': sense,
+            'm6_no_g_c_at_19': p['m6_no_g_c_19_point'],
+            'm6_no_g_c_19_point': p['m6_no_g_c_19_point'],
+            'm7_sense': sense,
+            'm7_a_at_3_19': p['m7_a_at_3_19_point'],
+            'm7_a_at_3_19_point': p['m7_a_at_3_19_point'],
+            'm8_sense': sense,
+            'm8_g_c_5_end': p['m8_g_c_5_end_point'],
+            'm8_g_c_5_end_point': p['m8_g_c_5_end_point'],
+            'm9_antisense': antisense,
+            'm9_a_at_6': p['m9_a_at_6_point'],
+            'm9_a_at_6_point': p['m9_a_at_6_point'],
+            'm10_antisense': antisense,
+            'm10_a_u_5_end': p['m10_a_u_5_end_point'],
+            'm10_a_u_5_end_point': p['m10_a_u_5_end_point'],
+        })
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+SAMPLE_SEED = 42
+POSITION_BINS = 10
+# z для двустороннего 95% интервала
+Z_95 = 1.959964
+
+
+def strata(lengths, starts, region_length, position_bins=POSITION_BINS):
+    """Номер страты для каждой пары: длина x участок региона (position_bins равных частей)"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    bins = np.minimum(np.asarray(starts, dtype=np.int64) * position_bins // max(region_length, 1),
+                      position_bins - 1)
+    return (lengths - lengths.min()) * position_bins + bins if len(lengths) else bins
+
+
+def allocate(stratum_sizes, sample_size):
+    """Пропорциональное распределение выборки по стратам (метод наибольших остатков),
+    не меньше одной пары на страту, если выборка это позволяет, и не больше размера страты"""
+    stratum_sizes = np.asarray(stratum_sizes, dtype=np.int64)
+    sample_size = min(sample_size, int(stratum_sizes.sum()))
+    exact = stratum_sizes * sample_size / max(stratum_sizes.sum(), 1)
+    counts = np.floor(exact).astype(np.int64)
+    if sample_size >= np.count_nonzero(stratum_sizes):
+        counts = np.maximum(counts, (stratum_sizes > 0).astype(np.int64))
+    counts = np.minimum(counts, stratum_sizes)
+    remainder = exact - np.floor(exact)
+    for stratum in np.argsort(-remainder, kind='stable'):
+        if counts.sum() >= sample_size:
+            break
+        if counts[stratum] < stratum_sizes[stratum]:
+            counts[stratum] += 1
+    # Минимум по одной паре мог превысить объем - лишнее снимается с самых больших страт
+    while counts.sum() > sample_size:
+        counts[np.argmax(counts)] -= 1
+    return counts
+
+
+def stratified_sample(stratum, sample_size, seed=SAMPLE_SEED):
+    """Номера строк стратифицированной выборки; порядок строк случаен, чтобы любой префикс
+    (первые завершенные батчи) тоже был приблизительно представительным"""
+    rng = np.random.default_rng(seed)
+    labels, sizes = np.unique(stratum, return_counts=True)
+    counts = allocate(sizes, sample_size)
+    rows = [rng.choice(np.flatnonzero(stratum == label), count, replace=False)
+            for label, count in zip(labels, counts) if count]
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    return rng.permutation(rows)
+
+
+def score_proportions(scores, sample_stratum, population_stratum, z=Z_95):
+    """Стратифицированная оценка долей score 0/1/2 с интервалами (нормальное приближение
+    с поправкой на конечную совокупность). Учитываются страты, где уже есть оцененные пары"""
+    scores = np.asarray(scores)
+    labels, population = np.unique(population_stratum, return_counts=True)
+    position = np.searchsorted(labels, sample_stratum)
+    n = np.bincount(position, minlength=len(labels))
+    covered = n > 0
+    weights = np.where(covered, population, 0) / max(population[covered].sum(), 1)
+
+    rows = []
+    for score in (2, 1, 0):
+        hits = np.bincount(position, weights=(scores == score).astype(np.float64), minlength=len(labels))
+        p_h = hits / np.maximum(n, 1)
+        estimate = (weights * p_h)[covered].sum()
+        # Дисперсия внутри страты; по одной паре ее не оценить - берется общая p(1 - p)
+        within = np.where(n > 1, p_h * (1 - p_h) * n / np.maximum(n - 1, 1), estimate * (1 - estimate))
+        fpc = 1 - n / population
+        variance = (weights ** 2 * within / np.maximum(n, 1) * fpc)[covered].sum()
+        margin = z * np.sqrt(variance)
+        rows.append({'blast_score': score, 'proportion': estimate,
+                     'ci_low': max(0.0, estimate - margin), 'ci_high': min(1.0, estimate + margin)})
+    estimates = pd.DataFrame(rows)
+    estimates.attrs.update(pairs=int(n.sum()), strata_covered=int(covered.sum()), strata=len(labels))
+    return estimates
+
+
+def format_estimates(estimates):
+    return ", ".join(f"score {row.blast_score}: {row.proportion * 100:.1f}% "
+                     f"[{row.ci_low * 100:.1f}-{row.ci_high * 100:.1f}]"
+                     for row in estimates.itertuples())
+
+
+class SampleTracker:
+    """Оценки по мере завершения батчей: пара оценена, когда известны результаты обеих ее цепей"""
+    def __init__(self, sense_index, antisense_index, sample_stratum, population_stratum, n_sequences):
+        # sense_index/antisense_index - номера последовательностей цепей для каждой пары выборки
+        self.sense_index = np.asarray(sense_index)
+        self.antisense_index = np.asarray(antisense_index)
+        self.sample_stratum = np.asarray(sample_stratum)
+        self.population_stratum = population_stratum
+        self.specific = np.full(n_sequences, np.nan)
+        self.estimates = None
+
+    def scores(self):
+        """Score пар (NaN - пара еще не оценена)"""
+        return self.specific[self.sense_index] + self.specific[self.antisense_index]
+
+    def add(self, result):
+        if result['status'] != 'success':
+            return
+        summary = result['summary']
+        self.specific[summary.index.to_numpy()] = summary['specific'].to_numpy(dtype=np.float64)
+        scores = self.scores()
+        done = ~np.isnan(scores)
+        if done.any():
+            self.estimates = score_proportions(scores[done].astype(np.int64), self.sample_stratum[done],
+                                               self.population_stratum)
+            tqdm.write(f"   Оценка по {done.sum()} парам: {format_estimates(self.estimates)}")
@@ -0,0 +1,121 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from fragments import FragmentTable
+from offtarget_index import encode, pack_kmers
+from snp_cache import is_fresh, source_fingerprint
+
+MANIFEST = "manifest.json"
+SEED_SIZE = 7
+# 3'UTR человека (FASTA, например из UCSC Table Browser или RefSeq)
+UTR_FASTA = "human_3utr.fasta"
+
+
+def table_dir_for(fasta_path):
+    return fasta_path + ".seed7"
+
+
+def build_seed_table(fasta_path, table_dir=None, with_transcripts=False):
+    """Однократный подсчет 7-меров по 3'UTR: число вхождений и число UTR с сайтом для всех 4^7 кодов.
+    with_transcripts - дополнительно списки UTR для каждого сайта (CSR: site_offsets + site_utrs)"""
+    from Bio import SeqIO
+    table_dir = table_dir or table_dir_for(fasta_path)
+    os.makedirs(table_dir, exist_ok=True)
+    ids, kmers, owners = [], [], []
+    for record in SeqIO.parse(fasta_path, "fasta"):
+        codes, valid = pack_kmers(encode(str(record.seq)), SEED_SIZE)
+        kmers.append(codes[valid])
+        owners.append(np.full(int(valid.sum()), len(ids), dtype=np.int32))
+        ids.append(record.id)
+    kmers = np.concatenate(kmers) if kmers else np.zeros(0, dtype=np.uint32)
+    owners = np.concatenate(owners) if owners else np.zeros(0, dtype=np.int32)
+
+    n_codes = 4 ** SEED_SIZE
+    np.save(os.path.join(table_dir, "counts.npy"), np.bincount(kmers, minlength=n_codes).astype(np.uint32))
+    # Пары (сайт, UTR) без повторов: сайт считается один раз на UTR
+    pairs = np.unique(kmers.astype(np.int64) * max(len(ids), 1) + owners)
+    sites, utrs = pairs // max(len(ids), 1), (pairs % max(len(ids), 1)).astype(np.int32)
+    utr_counts = np.bincount(sites, minlength=n_codes)
+    np.save(os.path.join(table_dir, "utr_counts.npy"), utr_counts.astype(np.uint32))
+    if with_transcripts:
+        np.save(os.path.join(table_dir, "site_offsets.npy"), np.concatenate([[0], np.cumsum(utr_counts)]))
+        np.save(os.path.join(table_dir, "site_utrs.npy"), utrs)
+    manifest = {'source': os.path.abspath(fasta_path), 'fingerprint': source_fingerprint(fasta_path),
+                'n_utrs': len(ids), 'ids': ids if with_transcripts else None}
+    with open(os.path.join(table_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    print(f"Таблица seed-сайтов {table_dir}: {len(ids)} 3'UTR, {len(kmers)} 7-меров")
+    return table_dir
+
+
+def seed_sites(guides):
+    """Коды сайтов-мишеней seed-региона (позиции 2-8 гида, 5'->3') в ориентации мРНК.
+    guides - FragmentTable antisense-гидов или список последовательностей; -1 - в seed есть N
+    или другой символ, кроме ACGU"""
+    if not isinstance(guides, FragmentTable):
+        guides = list(guides)
+        buffer = ''.join(guides)
+        lengths = np.fromiter(map(len, guides), dtype=np.int64, count=len(guides))
+        guides = FragmentTable(buffer.encode('ascii'), np.cumsum(lengths) - lengths, lengths)
+    codes = encode(guides.buffer)
+    seeds = codes[guides.starts.astype(np.int64)[:, None] + np.arange(1, SEED_SIZE + 1)]
+    # Сайт в мРНК комплементарен seed гида: обратный комплемент, упакованный по 2 бита
+    valid = (seeds <= 3).all(axis=1)
+    sites = np.zeros(len(seeds), dtype=np.int64)
+    for column in (3 - seeds[:, ::-1].astype(np.int64)).T:
+        sites = (sites << 2) | column
+    return np.where(valid, sites, -1)
+
+
+class SeedTable:
+    """Частоты seed-сайтов в 3'UTR: оценка miRNA-подобного off-target эффекта гида одним обращением к массиву"""
+    def __init__(self, table_dir):
+        with open(os.path.join(table_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.table_dir = table_dir
+        self.n_utrs = self.manifest['n_utrs']
+        self.counts = np.load(os.path.join(table_dir, "counts.npy"), mmap_mode='r')
+        self.utr_counts = np.load(os.path.join(table_dir, "utr_counts.npy"), mmap_mode='r')
+
+    @classmethod
+    def open(cls, fasta_path, table_dir=None, with_transcripts=False):
+        """Открывает таблицу рядом с FASTA; строит ее, если таблицы нет или FASTA изменился"""
+        table_dir = table_dir or table_dir_for(fasta_path)
+        manifest_path = os.path.join(table_dir, MANIFEST)
+        fresh = False
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            fresh = is_fresh(manifest, fasta_path) and (not with_transcripts or manifest['ids'] is not None)
+        if not fresh:
+            build_seed_table(fasta_path, table_dir, with_transcripts)
+        return cls(table_dir)
+
+    def score(self, guides):
+        """seed_sites (вхождений в 3'UTR), seed_utrs (UTR с сайтом), seed_frequency и seed_score:
+        1 - доля UTR с сайтом (1 - seed нигде не встречается). Для гидов с N в seed - пропуски"""
+        sites = seed_sites(guides)
+        valid = sites >= 0
+        sites = np.where(valid, sites, 0)
+        utrs = np.asarray(self.utr_counts[sites], dtype=np.int64)
+        frequency = np.where(valid, utrs / max(self.n_utrs, 1), np.nan)
+        return pd.DataFrame({
+            'seed_sites': pd.arrays.IntegerArray(np.asarray(self.counts[sites], dtype=np.int64), ~valid),
+            'seed_utrs': pd.arrays.IntegerArray(utrs, ~valid),
+            'seed_frequency': frequency,
+            'seed_score': 1 - frequency,
+        })
+
+    def transcripts(self, guide):
+        """3'UTR с сайтом seed-региона гида (нужна таблица, построенная с with_transcripts=True)"""
+        if self.manifest['ids'] is None:
+            raise ValueError("Таблица построена без списков транскриптов (with_transcripts=False)")
+        offsets = np.load(os.path.join(self.table_dir, "site_offsets.npy"), mmap_mode='r')
+        utrs = np.load(os.path.join(self.table_dir, "site_utrs.npy"), mmap_mode='r')
+        site = int(seed_sites([guide])[0])
+        if site < 0:
+            raise ValueError(f"В seed-регионе гида {guide} есть символы, кроме ACGU")
+        return [self.manifest['ids'][u] for u in utrs[offsets[site]:offsets[site + 1]]]
@@ -1,5 +1,18 @@
+import os
+
+import numpy as np
 import pandas as pd
-from prepare_rna import df_sense
+from prepare_rna import REGION, get_session
+from results_store import save_results
+from snp_cache import SnpCache
+from transcript_map import TranscriptMap
+from vcf_reader import read_vcf_region
+
+# VCF dbSNP (bgzip + .tbi) с частотами аллелей; если файла нет - используется BED
+VCF_FILE = "GCF_000001405.40.gz"
+# Аннотация генома (GTF/GFF3) и транскрипт sequence.fasta; без аннотации - линейный exon_coords
+GTF_FILE = "GCF_000001405.40_GRCh38.p14_genomic.gtf"
+TRANSCRIPT = "NM_000332.4"
 
 
 def convert_chromosome_format(chrom):
@@ -15,7 +28,11 @@ def convert_chromosome_format(chrom):
     return chrom_str.replace('chr', '')
 
 
-def read_bed_file(file_path):
+def read_bed_file(file_path, exon_coords=None):
+    if exon_coords is not None:
+        # Только строки региона экзона через индекс смещений рядом с BED-файлом
+        from bed_index import read_bed_region
+        return read_bed_region(file_path, exon_coords['chrom'], exon_coords['start'], exon_coords['end'] + 1)
     bed_columns = ['chrom', 'start', 'end', 'name', 'score', 'strand']
     df = pd.read_csv(file_path, sep='\t', header=None, comment='#')
     df.columns = bed_columns[:len(df.columns)]
@@ -28,7 +45,7 @@ def read_bed_file(file_path):
 def is_critical_position(pos, sirna_length):
     critical_positions = {
         1: "5'-конец",
-        19: "3'-конец",
+        sirna_length: "3'-конец",
         10: "сайт разрезания",
         11: "сайт разрезания"
     }
@@ -37,75 +54,262 @@ def is_critical_position(pos, sirna_length):
     return pos in critical_positions, critical_positions.get(pos, "не критичная")
 
 
+def critical_mask(positions, lengths):
+    """Векторная версия is_critical_position: positions - позиции (с 1) внутри siRNA длины lengths"""
+    positions = np.asarray(positions)
+    return ((positions >= 1) & (positions <= 8)) | (positions == 10) | (positions == 11) | (
+        positions == np.asarray(lengths))
+
+
+def select_exon_snps(snp_df, exon_coords):
+    """SNP, попадающие в экзон"""
+    return snp_df[
+        (snp_df['chrom'] == str(exon_coords['chrom'])) &
+        (snp_df['start'] >= exon_coords['start']) &
+        (snp_df['end'] <= exon_coords['end'])
+        ]
+
+
+class SnpIndex:
+    """Индекс SNP экзона: позиции отсортированы, SNP любого окна - срез через searchsorted"""
+    def __init__(self, positions, names=None, af=None):
+        positions = np.asarray(positions, dtype=np.int64)
+        order = np.argsort(positions, kind='stable')
+        self.positions = positions[order]
+        if names is None:
+            names = [''] * len(positions)
+        self.names = np.asarray(names, dtype=object)[order]
+        # Частоты альтернативных аллелей (из VCF); None - все SNP равноценны.
+        # SNP без частоты считается всегда присутствующим (AF=1): окно с ним не получает балл чистого окна
+        self.af = None if af is None else np.nan_to_num(np.asarray(af, dtype=np.float64)[order], nan=1.0)
+
+    @classmethod
+    def from_exon(cls, snps_in_exon, exon_start):
+        """Индекс по SNP экзона; позиции отсчитываются от exon_start, столбец af (если есть) - частоты"""
+        names = snps_in_exon['name'].to_numpy() if 'name' in snps_in_exon else None
+        af = snps_in_exon['af'].to_numpy() if 'af' in snps_in_exon else None
+        return cls((snps_in_exon['start'] - exon_start).to_numpy(), names, af)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def window(self, start, length):
+        """Срез индекса с SNP окна [start, start + length)"""
+        lo = np.searchsorted(self.positions, start, side='left')
+        hi = np.searchsorted(self.positions, start + length, side='left')
+        return slice(int(lo), int(hi))
+
+    def ranges(self, starts, lengths):
+        """Границы срезов (lo, hi) сразу для массива окон"""
+        starts = np.asarray(starts, dtype=np.int64)
+        lo = np.searchsorted(self.positions, starts, side='left')
+        hi = np.searchsorted(self.positions, starts + np.asarray(lengths, dtype=np.int64), side='left')
+        return lo, hi
+
+    def hits(self, starts, lengths):
+        """Все попадания SNP в окна: пары массивов (номер окна, номер SNP в индексе)"""
+        lo, hi = self.ranges(starts, lengths)
+        counts = hi - lo
+        window = np.repeat(np.arange(len(counts)), counts)
+        snp = np.arange(counts.sum()) + np.repeat(lo - np.cumsum(counts) + counts, counts)
+        return window, snp
+
+
+def critical_offsets(length):
+    """Смещения (с 0) критических позиций siRNA длины length: 5'-конец, seed 2-8, 10-11, 3'-конец"""
+    return sorted(o for o in set(range(8)) | {9, 10, length - 1} if 0 <= o < length)
+
+
+class SnpCoverage:
+    """Число SNP (всего и в критических позициях) для каждого окна (длина x начало) региона"""
+    def __init__(self, snp_index, region_length, start_size=15, end_size=30):
+        self.region_length = region_length
+        self.start_size = start_size
+        self.end_size = end_size
+        positions = snp_index.positions
+        positions = positions[(positions >= 0) & (positions < region_length)]
+        # Число SNP в каждой позиции региона и префиксные суммы
+        self.per_base = np.bincount(positions, minlength=region_length)
+        self.weighted = snp_index.af is not None
+        if self.weighted:
+            inside = (snp_index.positions >= 0) & (snp_index.positions < region_length)
+            af = np.clip(snp_index.af[inside], 0.0, 1.0)
+            # Суммарная частота и log P(нет варианта) по позициям; SNP с AF=1 (в т.ч. без частоты)
+            # считаются отдельно - окно с ними имеет вероятность ровно 0
+            self.per_base_af = np.bincount(positions, weights=af, minlength=region_length)
+            certain = af >= 1.0
+            log_clear = np.concatenate([[0.0], np.cumsum(np.bincount(
+                positions[~certain], weights=np.log1p(-af[~certain]), minlength=region_length))])
+            certain_prefix = np.concatenate([[0], np.cumsum(
+                np.bincount(positions[certain], minlength=region_length))])
+        prefix = np.concatenate([[0], np.cumsum(self.per_base)])
+
+        n_starts = max(region_length - start_size + 1, 0)
+        self.total = np.full((end_size - start_size + 1, n_starts), -1, dtype=np.int32)
+        self.critical = np.full_like(self.total, -1)
+        if self.weighted:
+            self.critical_af = np.full(self.total.shape, np.nan)
+            self.clear_probability = np.full(self.total.shape, np.nan)
+        for row, length in enumerate(range(start_size, end_size + 1)):
+            count = max(region_length - length + 1, 0)
+            starts = np.arange(count)
+            self.total[row, :count] = prefix[starts + length] - prefix[starts]
+            critical = np.zeros(count, dtype=np.int64)
+            for offset in critical_offsets(length):
+                critical += self.per_base[offset:offset + count]
+            self.critical[row, :count] = critical
+            if self.weighted:
+                critical_af = np.zeros(count)
+                for offset in critical_offsets(length):
+                    critical_af += self.per_base_af[offset:offset + count]
+                self.critical_af[row, :count] = critical_af
+                self.clear_probability[row, :count] = np.where(
+                    certain_prefix[starts + length] > certain_prefix[starts], 0.0,
+                    np.exp(log_clear[starts + length] - log_clear[starts]))
+
+    def _cells(self, starts, lengths):
+        """Строки и столбцы таблиц для окон; окна вне покрытия - ошибка, а не чужие значения"""
+        lengths = np.asarray(lengths, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        if ((lengths < self.start_size) | (lengths > self.end_size)).any():
+            raise ValueError(f"Длины окон вне диапазона покрытия {self.start_size}..{self.end_size}")
+        if ((starts < 0) | (starts + lengths > self.region_length)).any():
+            raise ValueError(f"Окна выходят за регион длины {self.region_length}")
+        return lengths - self.start_size, starts
+
+    def lookup(self, starts, lengths):
+        """(total, critical) для произвольных окон одним индексированием"""
+        rows, starts = self._cells(starts, lengths)
+        return self.total[rows, starts], self.critical[rows, starts]
+
+    def lookup_af(self, starts, lengths):
+        """(сумма частот SNP в критических позициях, вероятность отсутствия варианта в окне)"""
+        rows, starts = self._cells(starts, lengths)
+        return self.critical_af[rows, starts], self.clear_probability[rows, starts]
+
+
+def snp_scores(starts, lengths, snp_index, coverage=None):
+    """SNP-аннотация окон [start, start + length) региона (позиции - от начала экзона)"""
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if coverage is None:
+        coverage = SnpCoverage(snp_index, int((starts + lengths).max(initial=0)),
+                               int(lengths.min(initial=0)), int(lengths.max(initial=0)))
+    total, critical = coverage.lookup(starts, lengths)
+
+    # Имена нужны только для окон с критическими SNP
+    names = [''] * len(starts)
+    rows = np.flatnonzero(critical > 0)
+    window, snp = snp_index.hits(starts[rows], lengths[rows])
+    is_critical = critical_mask(snp_index.positions[snp] - starts[rows][window] + 1, lengths[rows][window])
+    for row, name in zip(rows[window[is_critical]].tolist(), snp_index.names[snp[is_critical]]):
+        names[row] = f"{names[row]}, {name}" if names[row] else str(name)
+
+    has_snp = total > 0
+    no_snp = (~has_snp).astype(np.int64)
+    result = pd.DataFrame({
+        'has_snp': has_snp,
+        'total_snps': total,
+        'critical_snps': critical,
+        'not_in_snp_sites_score': no_snp,
+        'no_critical_snps_score': (critical == 0).astype(np.int64),
+        'snp_avoidance_score': no_snp,
+        'total_score': no_snp,
+        'snp_names': names,
+    })
+    if coverage.weighted:
+        # С частотами: редкий SNP почти не снижает балл, частый полиморфизм - снижает сильно
+        critical_af, clear_probability = coverage.lookup_af(starts, lengths)
+        result.insert(3, 'critical_snps_af', critical_af)
+        result['snp_avoidance_score'] = clear_probability
+        result['total_score'] = clear_probability
+    return result
+
+
 def analyze_sirna_snp(sequence, start_pos, snps_in_exon, exon_start, sirna_length):
     result = {'has_snp': False, 'total_snps': 0, 'critical_snps': 0, 'snp_names': []}
+    snp_index = snps_in_exon if isinstance(snps_in_exon, SnpIndex) else SnpIndex.from_exon(snps_in_exon, exon_start)
 
-    for _, snp in snps_in_exon.iterrows():
-        snp_pos_in_exon = snp['start'] - exon_start
-        if start_pos <= snp_pos_in_exon < start_pos + sirna_length:
-            result['has_snp'] = True
-            result['total_snps'] += 1
-            snp_pos_in_sirna = snp_pos_in_exon - start_pos
-            is_critical, _ = is_critical_position(snp_pos_in_sirna, sirna_length)
-            if is_critical:
-                result['critical_snps'] += 1
-                result['snp_names'].append(snp['name'])
+    window = snp_index.window(start_pos, sirna_length)
+    for snp_pos_in_exon, name in zip(snp_index.positions[window], snp_index.names[window]):
+        result['has_snp'] = True
+        result['total_snps'] += 1
+        snp_pos_in_sirna = int(snp_pos_in_exon - start_pos) + 1
+        is_critical, _ = is_critical_position(snp_pos_in_sirna, sirna_length)
+        if is_critical:
+            result['critical_snps'] += 1
+            result['snp_names'].append(name)
 
     return result
 
 
-def create_sirna_dataframe(sequence_df, snp_df, exon_coords):
-    snps_in_exon = snp_df[
-        (snp_df['chrom'] == str(exon_coords['chrom'])) &
-        (snp_df['start'] >= exon_coords['start']) &
-        (snp_df['end'] <= exon_coords['end'])
-        ]
+def transcript_snp_index(snp_df, transcript_map, transcript_id, region_start=0):
+    """Индекс SNP в координатах транскрипта (от region_start): SNP интронов отбрасываются,
+    окна через сплайс-стыки и на минус-цепи получают правильные SNP"""
+    chrom = transcript_map.span(transcript_id)[0]
+    snp_df = snp_df[snp_df['chrom'] == str(chrom)]
+    positions = transcript_map.to_transcript(transcript_id, snp_df['start'].to_numpy())
+    exonic = positions >= 0
+    names = snp_df['name'].to_numpy()[exonic] if 'name' in snp_df else None
+    af = snp_df['af'].to_numpy()[exonic] if 'af' in snp_df else None
+    return SnpIndex(positions[exonic] - region_start, names, af)
+
+
+def create_sirna_dataframe(table, snp_df, exon_coords=None, snp_index=None):
+    """SNP-аннотация фрагментов FragmentTable (session.sense_table): начала и длины окон берутся из таблицы;
+    snp_index (см. transcript_snp_index) заменяет линейный exon_coords"""
+    if snp_index is None:
+        snp_index = SnpIndex.from_exon(select_exon_snps(snp_df, exon_coords), exon_coords['start'])
+
+    starts = table.starts.astype(np.int64)
+    lengths = table.lengths.astype(np.int64)
+    result = snp_scores(starts, lengths, snp_index)
+    result.insert(0, 'fragment_id', table.fragment_ids())
+    result.insert(1, 'sirna_sequence', [seq.upper().replace('U', 'T') for seq in table.sequences()])
+    result.insert(2, 'sirna_length', lengths)
+    # critical_snps_af есть только при частотах аллелей (VCF)
+    columns = ['fragment_id', 'sirna_sequence', 'sirna_length', 'has_snp', 'total_snps', 'critical_snps',
+               'critical_snps_af', 'not_in_snp_sites_score', 'no_critical_snps_score', 'snp_avoidance_score',
+               'total_score', 'snp_names']
+    return result[[column for column in columns if column in result]]
+
+
+
+if __name__ == "__main__":
+    exon_coords = {'chrom': '6', 'start': 16326394, 'end': 16328470}
+    snp_index = None
+    if os.path.exists(GTF_FILE):
+        # Экзонная структура транскрипта: SNP читаются по всему гену и переводятся в координаты мРНК
+        transcript_map = TranscriptMap.from_file(GTF_FILE, [TRANSCRIPT])
+        chrom, gene_start, gene_end = transcript_map.span(TRANSCRIPT)
+        region = {'chrom': chrom, 'start': gene_start, 'end': gene_end - 1}
+    else:
+        region = exon_coords
+    # Скомпилированный кэш SNP: BED разбирается только при первом запуске или после его изменения
+    if os.path.exists(VCF_FILE):
+        # VCF dbSNP с частотами аллелей: читается только регион экзона, баллы взвешиваются по AF
+        snp_df = read_vcf_region(VCF_FILE, region['chrom'], region['start'], region['end'] + 1)
+    else:
+        snp_df = SnpCache.open("Live RefSNPs dbSNP b157 v2.BED").region(
+            region['chrom'], region['start'], region['end'] + 1)
+    if os.path.exists(GTF_FILE):
+        snp_index = transcript_snp_index(snp_df, transcript_map, TRANSCRIPT, REGION[0])
+
+    results_df = create_sirna_dataframe(get_session().sense_table, snp_df, exon_coords, snp_index)
+    results_df.to_csv('sirna_snp_results.csv', index=False)
+    save_results(results_df, 'snp', columns=[column for column in [
+        'has_snp', 'total_snps', 'critical_snps', 'critical_snps_af', 'not_in_snp_sites_score',
+        'no_critical_snps_score', 'snp_avoidance_score', 'snp_names'] if column in results_df])
+    print("Анализ SNP\n"
+    'has_snp'        " - "   "Есть ли хотя бы один SNP в этой siRNA (True/False)\n"
+    'total_snps'     " - "    "Общее количество SNP в siRNA\n"
+    'critical_snps'  " - "    "Количество SNP в критических позициях\n"
+    'critical_snps_af' " - "  "Сумма частот SNP в критических позициях (только для VCF с частотами)\n"
+    'snp_names'      " - "    "Имена критических SNP через запятую\n"
 
-    data = []
-    for _, seq_row in sequence_df.iterrows():
-        sequence = str(seq_row['sequence']).upper().replace('U', 'T')
-        sirna_length = seq_row['size_nt']
-
-
-        for i in range(len(sequence) - sirna_length + 1):
-            snp_analysis = analyze_sirna_snp(sequence, i, snps_in_exon, exon_coords['start'], sirna_length)
-
-            not_in_snp_score = 1 if not snp_analysis['has_snp'] else 0
-            no_critical_score = 1 if snp_analysis['critical_snps'] == 0 else 0
-            snp_avoidance_score = 1 if not snp_analysis['has_snp'] else 0
-
-            data.append({
-                'fragment_id': seq_row['fragment_id'],
-                'sirna_sequence': sequence[i:i + sirna_length],
-                'sirna_length': sirna_length,
-                'has_snp': snp_analysis['has_snp'],
-                'total_snps': snp_analysis['total_snps'],
-                'critical_snps': snp_analysis['critical_snps'],
-                'not_in_snp_sites_score': not_in_snp_score,
-                'no_critical_snps_score': no_critical_score,
-                'snp_avoidance_score': snp_avoidance_score,
-                'total_score': snp_avoidance_score,
-                'snp_names': ', '.join(snp_analysis['snp_names'])
-            })
-
-    return pd.DataFrame(data)
-
-
-
-snp_df = read_bed_file("Live RefSNPs dbSNP b157 v2.BED")
-exon_coords = {'chrom': '6', 'start': 16326394, 'end': 16328470}
-
-results_df = create_sirna_dataframe(df_sense, snp_df, exon_coords)
-results_df.to_csv('sirna_snp_results.csv', index=False)
-print("Анализ SNP\n"
-'has_snp'        " - "   "Есть ли хотя бы один SNP в этой siRNA (True/False)\n"
-'total_snps'     " - "    "Общее количество SNP в siRNA\n"
-'critical_snps'  " - "    "Количество SNP в критических позициях\n"
-'snp_names'      " - "    "Имена критических SNP через запятую\n"
-
-"Система баллов\n"
-'not_in_snp_sites_score'  " - "   "1 если нет SNP, 0 если есть SNP\n"
-'no_critical_snps_score'  " - "   "1 если нет критических SNP, 0 если есть\n"
-'snp_avoidance_score'     " - "   "1 (нет SNP), 0 (есть критические SNP, есть SNP но не критические)\n"
-'total_score'             " - "   "Общий балл (равен snp_avoidance_score)\n"
-)
\ No newline at end of file
+    "Система баллов\n"
+    'not_in_snp_sites_score'  " - "   "1 если нет SNP, 0 если есть SNP\n"
+    'no_critical_snps_score'  " - "   "1 если нет критических SNP, 0 если есть\n"
+    'snp_avoidance_score'     " - "   "1 (нет SNP), 0 (есть критические SNP, есть SNP но не критические)\n"
+    'total_score'             " - "   "Общий балл (равен snp_avoidance_score)\n"
+    )
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+CHUNK_ROWS = 5_000_000
+# Сколько байт с начала, середины и конца файла входит в хэш источника
+HASH_BLOCK = 1 << 20
+
+
+def cache_dir_for(bed_path):
+    return bed_path + ".snpcache"
+
+
+def source_fingerprint(path):
+    """Размер, mtime и sha256 по трем блокам файла (начало, середина, конец) - без чтения всех десятков ГБ"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(stat.st_size // 2 - HASH_BLOCK // 2, 0), max(stat.st_size - HASH_BLOCK, 0)}):
+            f.seek(offset)
+            digest.update(f.read(HASH_BLOCK))
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest.hexdigest()}
+
+
+def _safe_name(chrom):
+    return ''.join(c if c.isalnum() else '_' for c in str(chrom))
+
+
+def compile_snp_cache(bed_path, cache_dir=None, chunk_rows=CHUNK_ROWS):
+    """Один проход по BED порциями: позиции, концы и rsID каждой хромосомы дописываются в сырые файлы"""
+    from snp import convert_chromosome_format
+    cache_dir = cache_dir or cache_dir_for(bed_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    chroms = {}
+    handles = {}
+    try:
+        reader = pd.read_csv(bed_path, sep='\t', header=None, comment='#', usecols=[0, 1, 2, 3],
+                             names=['chrom', 'start', 'end', 'name'], dtype={'chrom': str, 'name': str},
+                             chunksize=chunk_rows)
+        for chunk in reader:
+            # Имена хромосом нормализуются один раз на уникальное значение порции
+            raw = chunk['chrom'].astype('category')
+            chunk['chrom'] = raw.cat.rename_categories(
+                [str(convert_chromosome_format(c)) for c in raw.cat.categories]).astype(str)
+            for chrom, group in chunk.groupby('chrom', sort=False):
+                if chrom not in chroms:
+                    base = os.path.join(cache_dir, _safe_name(chrom))
+                    chroms[chrom] = {'prefix': _safe_name(chrom), 'count': 0, 'name_bytes': 0,
+                                     'sorted': True, 'last_start': -1}
+                    handles[chrom] = {part: open(f"{base}.{part}", 'wb')
+                                      for part in ('starts', 'ends', 'name_offsets', 'name_lengths', 'names')}
+                entry, files = chroms[chrom], handles[chrom]
+                starts = group['start'].to_numpy(dtype=np.int64)
+                ends = group['end'].to_numpy(dtype=np.int64)
+                names = [name.encode('ascii') for name in group['name'].fillna('')]
+                lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+                offsets = entry['name_bytes'] + np.cumsum(lengths) - lengths
+
+                if len(starts) and (starts[0] < entry['last_start'] or (np.diff(starts) < 0).any()):
+                    entry['sorted'] = False
+                entry['last_start'] = int(starts[-1]) if len(starts) else entry['last_start']
+                files['starts'].write(starts.tobytes())
+                files['ends'].write(ends.tobytes())
+                files['name_offsets'].write(offsets.tobytes())
+                files['name_lengths'].write(lengths.astype(np.uint16).tobytes())
+                files['names'].write(b''.join(names))
+                entry['count'] += len(starts)
+                entry['name_bytes'] += int(lengths.sum())
+    finally:
+        for files in handles.values():
+            for f in files.values():
+                f.close()
+
+    for entry in chroms.values():
+        entry.pop('last_start')
+    manifest = {'source': os.path.abspath(bed_path), 'fingerprint': source_fingerprint(bed_path),
+                'chroms': chroms}
+    with open(os.path.join(cache_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    print(f"Кэш SNP {cache_dir}: {sum(e['count'] for e in chroms.values())} SNP, {len(chroms)} хромосом")
+    return manifest
+
+
+def is_fresh(manifest, source_path):
+    """Кэш (индекс) актуален, если совпадают размер и mtime, а при другом mtime - хэш источника"""
+    stat = os.stat(source_path)
+    saved = manifest['fingerprint']
+    if saved['size'] != stat.st_size:
+        return False
+    if saved['mtime'] == stat.st_mtime:
+        return True
+    return source_fingerprint(source_path)['sha256'] == saved['sha256']
+
+
+class SnpCache:
+    """Скомпилированные SNP по хромосомам: массивы отображаются в память только для чтения"""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self._arrays = {}
+
+    @classmethod
+    def open(cls, bed_path, cache_dir=None):
+        """Открывает кэш; компилирует его, если кэша нет или источник изменился"""
+        cache_dir = cache_dir or cache_dir_for(bed_path)
+        manifest_path = os.path.join(cache_dir, MANIFEST)
+        fresh = False
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                fresh = is_fresh(json.load(f), bed_path)
+        if not fresh:
+            compile_snp_cache(bed_path, cache_dir)
+        return cls(cache_dir)
+
+    def __getstate__(self):
+        # В рабочие процессы передается только путь: массивы заново отображаются там же из файлов
+        return {'cache_dir': self.cache_dir, 'manifest': self.manifest}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._arrays = {}
+
+    @property
+    def chroms(self):
+        return list(self.manifest['chroms'])
+
+    def arrays(self, chrom):
+        """(starts, ends, name_offsets, name_lengths, names) хромосомы - np.memmap без копирования"""
+        chrom = str(chrom)
+        if chrom not in self._arrays:
+            entry = self.manifest['chroms'].get(chrom)
+            if entry is None:
+                empty = np.zeros(0, dtype=np.int64)
+                return empty, empty, empty, np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint8)
+            base = os.path.join(self.cache_dir, entry['prefix'])
+            count = entry['count']
+
+            def load(part, dtype, size):
+                if size == 0:
+                    return np.zeros(0, dtype=dtype)
+                return np.memmap(f"{base}.{part}", dtype=dtype, mode='r', shape=(size,))
+            arrays = (load('starts', np.int64, count), load('ends', np.int64, count),
+                      load('name_offsets', np.int64, count), load('name_lengths', np.uint16, count),
+                      load('names', np.uint8, entry['name_bytes']))
+            if not entry['sorted']:
+                # Несортированный источник: порядок восстанавливается один раз (с копированием)
+                order = np.argsort(arrays[0], kind='stable')
+                arrays = tuple(a[order] for a in arrays[:4]) + (arrays[4],)
+            self._arrays[chrom] = arrays
+        return self._arrays[chrom]
+
+    def names(self, chrom, rows):
+        """rsID по номерам строк хромосомы"""
+        _, _, name_offsets, name_lengths, blob = self.arrays(chrom)
+        rows = np.asarray(rows, dtype=np.int64)
+        return [bytes(blob[o:o + n]).decode('ascii')
+                for o, n in zip(name_offsets[rows].tolist(), name_lengths[rows].tolist())]
+
+    def region(self, chrom, start, end):
+        """SNP, начинающиеся в [start, end), в формате read_bed_file (chrom, start, end, name)"""
+        starts, ends = self.arrays(chrom)[:2]
+        lo, hi = np.searchsorted(starts, [start, end], side='left')
+        rows = np.arange(lo, hi)
+        return pd.DataFrame({
+            'chrom': str(chrom),
+            'start': np.asarray(starts[lo:hi]),
+            'end': np.asarray(ends[lo:hi]),
+            'name': self.names(chrom, rows) if len(rows) else [],
+        })
@@ -0,0 +1,26 @@
+import numpy as np
+
+from fragments import FragmentTable
+
+# Таблицы перекодировки байтов: ДНК/РНК в любом регистре -> РНК-алфавит
+_TO_RNA = bytes.maketrans(b'acgutT', b'ACGUUU')
+_TO_COMPLEMENT = bytes.maketrans(b'ACGUTacgut', b'UGCAAUGCAA')
+
+
+class StrandViews:
+    """Sense, complement и reverse-complement региона, каждое - один проход bytes.translate"""
+    def __init__(self, region):
+        raw = region.encode('ascii') if isinstance(region, str) else bytes(region)
+        self.sense = raw.translate(_TO_RNA)
+        self.complement = raw.translate(_TO_COMPLEMENT)
+        self.reverse_complement = self.complement[::-1]
+
+    def __len__(self):
+        return len(self.sense)
+
+    def guide_table(self, sense_table):
+        """Antisense-гиды (5'->3') для каждого sense-окна; partner[i] - номер sense-партнера"""
+        starts = len(self.sense) - sense_table.starts.astype(np.int64) - sense_table.lengths
+        return FragmentTable(self.reverse_complement, starts, sense_table.lengths,
+                             id_starts=sense_table.id_starts,
+                             partner=np.arange(len(sense_table), dtype=np.int32))
@@ -0,0 +1,42 @@
+import gzip
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vcf_reader import parse_af, read_vcf_region
+
+# Запись dbSNP b152+: частоты только в FREQ, без AF/CAF/TOPMED
+FREQ_INFO = "RS=1800;dbSNPBuildID=144;SSR=0;VC=SNV;FREQ=1000Genomes:0.9,0.1|GnomAD:0.99,0.01|TOPMED:.,0.02,0.001"
+
+
+def test_freq_max_over_studies():
+    assert parse_af(FREQ_INFO) == pytest.approx(0.1)
+
+
+def test_freq_chosen_study():
+    assert parse_af(FREQ_INFO, study='GnomAD') == pytest.approx(0.01)
+    # REF неизвестна - сумма ALT
+    assert parse_af(FREQ_INFO, study='TOPMED') == pytest.approx(0.021)
+    assert math.isnan(parse_af(FREQ_INFO, study='KOREAN'))
+
+
+def test_fallback_fields():
+    assert parse_af("FREQ=GnomAD:.,.;CAF=0.8,0.2") == pytest.approx(0.2)
+    assert parse_af("CAF=.,0.01") == pytest.approx(0.01)
+    assert math.isnan(parse_af("RS=1"))
+
+
+def test_read_vcf_region_freq(tmp_path):
+    path = tmp_path / "dbsnp.vcf.gz"
+    with gzip.open(path, 'wt') as f:
+        f.write("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        f.write(f"NC_000006.12\t100\trs1\tA\tG\t.\t.\t{FREQ_INFO}\n")
+        f.write("NC_000006.12\t150\trs2\tC\tT\t.\t.\tRS=2\n")
+    snps = read_vcf_region(str(path), '6', 0, 1000)
+    assert snps['name'].tolist() == ['rs1', 'rs2']
+    assert snps['af'].iloc[0] == pytest.approx(0.1)
+    assert math.isnan(snps['af'].iloc[1])
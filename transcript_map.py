@@ -0,0 +1,136 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1_000_000
+# transcript_id в GTF (transcript_id "NM_000332.4") и GFF3 (transcript_id=NM_000332.4 или Parent=rna-NM_000332.4)
+TRANSCRIPT_ID = re.compile(r'transcript_id[ =]"?([^";]+)')
+PARENT_ID = re.compile(r'Parent=(?:transcript:|rna-)?([^;,]+)')
+
+
+def read_exons(path, transcript_ids=None, chunk_rows=CHUNK_ROWS):
+    """Экзоны из GTF/GFF3: chrom, start (0-based), end, strand, transcript_id.
+    transcript_ids - оставить только эти транскрипты (с версией или без)"""
+    from snp import convert_chromosome_format
+    wanted = None if transcript_ids is None else {t.split('.')[0] for t in transcript_ids}
+    parts = []
+    reader = pd.read_csv(path, sep='\t', header=None, comment='#', usecols=[0, 2, 3, 4, 6, 8],
+                         names=['chrom', 'feature', 'start', 'end', 'strand', 'attributes'],
+                         dtype={'chrom': str, 'feature': str, 'strand': str, 'attributes': str},
+                         chunksize=chunk_rows)
+    for chunk in reader:
+        chunk = chunk[chunk['feature'] == 'exon']
+        if chunk.empty:
+            continue
+        ids = chunk['attributes'].str.extract(TRANSCRIPT_ID, expand=False)
+        ids = ids.fillna(chunk['attributes'].str.extract(PARENT_ID, expand=False))
+        chunk = chunk.assign(transcript_id=ids).dropna(subset=['transcript_id'])
+        if wanted is not None:
+            chunk = chunk[chunk['transcript_id'].str.split('.').str[0].isin(wanted)]
+        parts.append(chunk[['chrom', 'start', 'end', 'strand', 'transcript_id']])
+
+    if not parts:
+        return pd.DataFrame(columns=['chrom', 'start', 'end', 'strand', 'transcript_id'])
+    exons = pd.concat(parts, ignore_index=True)
+    raw = exons['chrom'].astype('category')
+    exons['chrom'] = raw.cat.rename_categories(
+        [str(convert_chromosome_format(c)) for c in raw.cat.categories]).astype(str)
+    exons['start'] = exons['start'].astype(np.int64) - 1
+    exons['end'] = exons['end'].astype(np.int64)
+    return exons
+
+
+class TranscriptMap:
+    """Экзонная структура транскриптов в отсортированных массивах:
+    перевод координат транскрипт <-> геном для массивов позиций и окон без циклов по окнам"""
+    def __init__(self, exons):
+        # Экзоны в порядке транскрипта: по возрастанию координат для '+', по убыванию для '-'
+        exons = exons.assign(_key=np.where(exons['strand'] == '-', -exons['start'], exons['start']))
+        exons = exons.sort_values(['transcript_id', '_key'], kind='stable').reset_index(drop=True)
+        self.genome_start = exons['start'].to_numpy(dtype=np.int64)
+        self.genome_end = exons['end'].to_numpy(dtype=np.int64)
+        lengths = self.genome_end - self.genome_start
+
+        ids, first = np.unique(exons['transcript_id'].to_numpy(dtype=str), return_index=True)
+        self.transcript_ids = ids
+        self.bounds = np.append(first, len(exons)).astype(np.int64)
+        self.chroms = exons['chrom'].to_numpy(dtype=str)[first]
+        self.strands = exons['strand'].to_numpy(dtype=str)[first]
+        # Смещение начала каждого экзона в транскрипте: cumsum длин с обнулением на границе транскрипта
+        cumulative = np.cumsum(lengths) - lengths
+        self.transcript_offset = cumulative - np.repeat(cumulative[first], np.diff(self.bounds))
+        self.transcript_length = np.add.reduceat(lengths, first) if len(first) else np.zeros(0, dtype=np.int64)
+        self._rows = {t: row for row, t in enumerate(ids)}
+        self._rows.update({t.split('.')[0]: row for row, t in enumerate(ids)})
+
+    @classmethod
+    def from_file(cls, path, transcript_ids=None):
+        return cls(read_exons(path, transcript_ids))
+
+    def __len__(self):
+        return len(self.transcript_ids)
+
+    def _exons(self, transcript_id):
+        row = self._rows.get(transcript_id, self._rows.get(transcript_id.split('.')[0]))
+        if row is None:
+            raise KeyError(f"Транскрипт {transcript_id} не найден в аннотации")
+        exons = slice(self.bounds[row], self.bounds[row + 1])
+        return row, self.genome_start[exons], self.genome_end[exons], self.transcript_offset[exons]
+
+    def span(self, transcript_id):
+        """(chrom, start, end) геномного участка транскрипта - для чтения SNP одного региона"""
+        row, starts, ends, _ = self._exons(transcript_id)
+        return str(self.chroms[row]), int(starts.min()), int(ends.max())
+
+    def to_genome(self, transcript_id, positions):
+        """Геномные позиции (0-based) для позиций транскрипта; вне транскрипта - -1"""
+        row, starts, ends, offsets = self._exons(transcript_id)
+        positions = np.asarray(positions, dtype=np.int64)
+        exon = np.clip(np.searchsorted(offsets, positions, side='right') - 1, 0, len(offsets) - 1)
+        inside = positions - offsets[exon]
+        if self.strands[row] == '-':
+            genome = ends[exon] - 1 - inside
+        else:
+            genome = starts[exon] + inside
+        valid = (positions >= 0) & (positions < self.transcript_length[row])
+        return np.where(valid, genome, -1)
+
+    def to_transcript(self, transcript_id, genome_positions):
+        """Позиции транскрипта для геномных позиций; интрон или вне транскрипта - -1"""
+        row, starts, ends, offsets = self._exons(transcript_id)
+        genome_positions = np.asarray(genome_positions, dtype=np.int64)
+        minus = self.strands[row] == '-'
+        if minus:
+            # Для searchsorted нужны возрастающие координаты
+            starts, ends, offsets = starts[::-1], ends[::-1], offsets[::-1]
+        exon = np.clip(np.searchsorted(starts, genome_positions, side='right') - 1, 0, len(starts) - 1)
+        inside = (genome_positions >= starts[exon]) & (genome_positions < ends[exon])
+        if minus:
+            positions = offsets[exon] + (ends[exon] - 1 - genome_positions)
+        else:
+            positions = offsets[exon] + (genome_positions - starts[exon])
+        return np.where(inside, positions, -1)
+
+    def window_segments(self, transcript_id, starts, lengths):
+        """Геномные отрезки окон транскрипта [start, start + length): окно через сплайс-стык дает
+        несколько отрезков. Столбцы: window (номер окна), chrom, start, end (0-based, полуинтервал)"""
+        row, genome_starts, genome_ends, offsets = self._exons(transcript_id)
+        starts = np.asarray(starts, dtype=np.int64)
+        window_ends = starts + np.asarray(lengths, dtype=np.int64)
+        first = np.searchsorted(offsets, starts, side='right') - 1
+        last = np.searchsorted(offsets, window_ends - 1, side='right') - 1
+        counts = last - first + 1
+
+        window = np.repeat(np.arange(len(starts)), counts)
+        exon = np.repeat(first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        exon_lengths = genome_ends[exon] - genome_starts[exon]
+        # Часть окна внутри экзона в координатах экзона
+        lo = np.maximum(starts[window] - offsets[exon], 0)
+        hi = np.minimum(window_ends[window] - offsets[exon], exon_lengths)
+        if self.strands[row] == '-':
+            segment_start, segment_end = genome_ends[exon] - hi, genome_ends[exon] - lo
+        else:
+            segment_start, segment_end = genome_starts[exon] + lo, genome_starts[exon] + hi
+        return pd.DataFrame({'window': window, 'chrom': self.chroms[row],
+                             'start': segment_start, 'end': segment_end})
@@ -0,0 +1,165 @@
+import gzip
+import math
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Поля INFO с частотой альтернативного аллеля. FREQ (dbSNP b152+: "исследование:REF,ALT,...|...") и
+# CAF/TOPMED (старые выпуски dbSNP) хранят частоты всех аллелей, начиная с REF; AF - только ALT
+AF_FIELDS = ('FREQ', 'AF', 'CAF', 'TOPMED')
+# Исследование для FREQ; None - максимум частоты ALT по всем исследованиям (осторожная оценка)
+FREQ_STUDY = None
+# Размер окна линейного индекса tabix
+TABIX_SHIFT = 14
+
+
+def _alt_frequency(raw):
+    """Частота ALT из списка частот аллелей "REF,ALT,...": 1 - REF, без REF - сумма известных ALT"""
+    # Позиции значений сохраняются: '.' на месте REF не должен сдвигать частоты ALT
+    numbers = [math.nan if v in ('.', '') else float(v) for v in raw.split(',')]
+    ref, alts = numbers[0], [v for v in numbers[1:] if not math.isnan(v)]
+    if not math.isnan(ref):
+        return 1.0 - ref
+    return float(sum(alts)) if alts else math.nan
+
+
+def parse_freq(raw, study=FREQ_STUDY):
+    """Частота ALT из FREQ=GnomAD:0.99,0.01|1000Genomes:...: по исследованию study или максимум по всем"""
+    frequencies = {}
+    for item in raw.split('|'):
+        name, _, values = item.partition(':')
+        frequency = _alt_frequency(values)
+        if not math.isnan(frequency):
+            frequencies[name] = frequency
+    if study is not None:
+        return frequencies.get(study, math.nan)
+    return max(frequencies.values()) if frequencies else math.nan
+
+
+def parse_af(info, fields=AF_FIELDS, study=FREQ_STUDY):
+    """Суммарная частота альтернативных аллелей из INFO (NaN, если поля нет)"""
+    values = dict(item.split('=', 1) for item in info.split(';') if '=' in item)
+    for field in fields:
+        raw = values.get(field)
+        if raw is None:
+            continue
+        if field == 'FREQ':
+            frequency = parse_freq(raw, study)
+        elif field in ('CAF', 'TOPMED'):
+            frequency = _alt_frequency(raw)
+        else:
+            known = [float(v) for v in raw.split(',') if v not in ('.', '')]
+            frequency = float(sum(known)) if known else math.nan
+        if not math.isnan(frequency):
+            return frequency
+    return math.nan
+
+
+def _normalizer():
+    from snp import convert_chromosome_format
+    cache = {}
+
+    def normalize(raw):
+        if raw not in cache:
+            cache[raw] = str(convert_chromosome_format(raw))
+        return cache[raw]
+    return normalize
+
+
+def read_tabix_index(tbi_path):
+    """Имена последовательностей и линейные индексы (виртуальные смещения BGZF) из .tbi"""
+    with gzip.open(tbi_path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'TBI\x01':
+        raise ValueError(f"{tbi_path}: это не индекс tabix")
+    n_ref, _, _, _, _, _, _, l_nm = struct.unpack_from('<8i', data, 4)
+    offset = 36
+    names = data[offset:offset + l_nm].split(b'\x00')[:n_ref]
+    offset += l_nm
+    linear = {}
+    for name in names:
+        (n_bin,) = struct.unpack_from('<i', data, offset)
+        offset += 4
+        for _ in range(n_bin):
+            _, n_chunk = struct.unpack_from('<Ii', data, offset)
+            offset += 8 + 16 * n_chunk
+        (n_intv,) = struct.unpack_from('<i', data, offset)
+        offset += 4
+        linear[name.decode('ascii')] = np.frombuffer(data, dtype='<u8', count=n_intv, offset=offset)
+        offset += 8 * n_intv
+    return linear
+
+
+def _tabix_lines(path, chrom, start):
+    """Строки bgzip-VCF, начиная с первого блока, который может содержать start (seek по .tbi)"""
+    normalize = _normalizer()
+    for name, intervals in read_tabix_index(path + '.tbi').items():
+        if normalize(name) != str(chrom):
+            continue
+        window = start >> TABIX_SHIFT
+        if window >= len(intervals):
+            return
+        virtual_offset = int(intervals[window])
+        with open(path, 'rb') as raw:
+            raw.seek(virtual_offset >> 16)
+            with gzip.GzipFile(fileobj=raw) as f:
+                f.read(virtual_offset & 0xFFFF)
+                yield from f
+        return
+
+
+def _indexed_lines(path, chrom, start, end):
+    """Строки несжатого VCF через индекс смещений bed_index (POS - второй столбец)"""
+    from bed_index import load_bed_index, region_lines
+    index = load_bed_index(path, start_column=1)
+    return region_lines(path, chrom, start + 1, end + 1, index)
+
+
+def _stream_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        yield from f
+
+
+def read_vcf_region(path, chrom, start, end, af_fields=AF_FIELDS):
+    """Варианты с позицией в [start, end) (0-based, как в BED) и их частоты.
+    Файл читается потоково: bgzip+tbi и несжатый VCF - с переходом к региону, иначе до конца региона"""
+    if path.endswith('.gz') and os.path.exists(path + '.tbi'):
+        lines = _tabix_lines(path, chrom, start)
+    elif not path.endswith('.gz'):
+        lines = _indexed_lines(path, chrom, start, end)
+    else:
+        lines = _stream_lines(path)
+
+    normalize = _normalizer()
+    chrom = str(chrom)
+    seen_chrom = False
+    positions, ends, names, frequencies = [], [], [], []
+    for line in lines:
+        if line.startswith(b'#'):
+            continue
+        fields = line.rstrip(b'\n').split(b'\t', 8)
+        if normalize(fields[0].decode('ascii')) != chrom:
+            if seen_chrom:
+                break
+            continue
+        seen_chrom = True
+        position = int(fields[1]) - 1
+        if position >= end:
+            break
+        if position < start:
+            continue
+        positions.append(position)
+        ends.append(position + len(fields[3]))
+        names.append(fields[2].decode('ascii'))
+        frequencies.append(parse_af(fields[7].decode('ascii'), af_fields) if len(fields) > 7 else math.nan)
+
+    return pd.DataFrame({
+        'chrom': chrom,
+        'start': np.asarray(positions, dtype=np.int64),
+        'end': np.asarray(ends, dtype=np.int64),
+        'name': names,
+        'af': np.asarray(frequencies, dtype=np.float32),
+    })